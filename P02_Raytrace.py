@@ -1,18 +1,44 @@
 import os
-import sys
 import math
+import time
+import copy
+import json
+import argparse
+import multiprocessing
+import multiprocessing.util
 
 from common.utils import put_your_code_here, timed_call
 from common.maths import Vector, Point, Normal, Ray, Direction, Frame, sqrt
 from common.scene import Scene, Material, scene_from_file
-from common.image import Image
+from common.scene import RenderScene, RenderSurface, compile_scene
+from common.scene import SURFACE_SPHERE, SURFACE_QUAD, SURFACE_CIRCLE
+from common.image import Image, SharedImage, save_rows
+from common.options import RenderOptions, ENGINES, ENGINE_FAST, ENGINE_NUMPY, SCHEDULERS, SCHEDULER_POOL
+from common.stats import RenderStats
+from common.scheduler import TileScheduler
+from common.wavefront import raytrace_wavefront
+from common import kernels
+from common import trace
 
 '''
 The following functions provide algorithms for raytracing a scene.
 
-`raytrace` renders an image for given scene by calling `irradiance`.
+`render` and `render_file` are the library entry points (`main` is the CLI).
+`raytrace` renders an image for given scene by calling `raytrace_tile`,
+    optionally across a pool of worker processes.  The scene is first
+    compiled to a RenderScene (see `compile_scene`).
+`raytrace_rows` renders the same pixels, but yields rows in order as they
+    are completed (`raytrace_to_file` streams them into a PNG file).
+`render_with_stats` also returns RenderStats (ray and intersection test
+    counts, phase timings) of the render (see common/stats.py).
+`raytrace_tile` renders a rectangle of the image by calling `irradiance`
+    (or, with the 'fast' engine, `kernels.raytrace_tile`, which does the
+    same math on plain floats; see common/kernels.py).
 `irradiance` computes irradiance from scene along ray (reversed).
 `intersect` computes intersection details between ray and scene.
+`intersect_surface` computes ray t of intersection between ray and a surface
+    (dispatching on surface kind to `intersect_sphere`, `intersect_quad`, ...).
+`occluded` checks if anything in scene blocks ray (shadow rays).
 
 You will provide your implementation to each of the functions below.
 We have left pseudocode in comments for all problems but extra credits.
@@ -42,28 +68,117 @@ Remove the `@put_your_code_here` function decorators to remove the
 class Intersection:
     '''
     Stores information about the point of intersection:
-        ray_t: t value along ray to intersection (evaluating ray at t will give pos)
-        frame: shading frame of intersection (o: point of intersection, z: normal at intersection)
-        mat:   the material of surface that was intersected
+        ray_t:   t value along ray to intersection (evaluating ray at t will give pos)
+        pos:     point of intersection
+        normal:  normal at intersection
+        mat:     the material of surface that was intersected
+        surface: the surface that was intersected
+        frame:   shading frame of intersection (o: pos, z: normal), built on first access
+
+    An Intersection is only created for the closest hit of a ray; the BVH
+    traversal keeps just the t and surface index of the closest hit so far.
     '''
 
-    def __init__(self, ray_t:float, frame:Frame, mat:Material):
-        self.ray_t = ray_t
-        self.frame = frame
-        self.mat   = mat
-
-
-def intersect(scene:Scene, ray:Ray):
-    ''' returns shading frame at intersection of ray with scene; otherwise returns None '''
+    __slots__ = ['ray_t','pos','normal','mat','surface','_frame']
+
+    def __init__(self, ray_t:float, pos:Point, normal:Direction, mat:Material, surface:RenderSurface=None):
+        self.ray_t   = ray_t
+        self.pos     = pos
+        self.normal  = normal
+        self.mat     = mat
+        self.surface = surface
+        self._frame  = None
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = Frame.from_z(self.pos, self.normal)
+        return self._frame
+
+
+def intersect_sphere(surface:RenderSurface, ray:Ray):
+    ''' returns ray t of intersection of ray with sphere surface; otherwise returns None '''
+    e,d = ray.e,ray.d
+    vx,vy,vz = e.x - surface.ox, e.y - surface.oy, e.z - surface.oz
+    b = 2 * (d.x * vx + d.y * vy + d.z * vz)
+    c = (vx * vx + vy * vy + vz * vz) - surface.radius2
+    disc = b * b - 4 * c
+    if disc < 0:
+        return None
+    return (-b - math.sqrt(disc)) / 2
+
+def _intersect_plane(surface:RenderSurface, ray:Ray):
+    ''' returns ray t and local (x,y) of intersection of ray with plane of quad/circle surface; None if ray is parallel to plane '''
+    e,d = ray.e,ray.d
+    nx,ny,nz = surface.nx,surface.ny,surface.nz
+    dn = d.x * nx + d.y * ny + d.z * nz
+    if dn == 0:
+        return None
+    t = (surface.d - (nx * e.x + ny * e.y + nz * e.z)) / dn
+    vx = e.x + d.x * t - surface.ox
+    vy = e.y + d.y * t - surface.oy
+    vz = e.z + d.z * t - surface.oz
+    lx = surface.xx * vx + surface.xy * vy + surface.xz * vz
+    ly = surface.yx * vx + surface.yy * vy + surface.yz * vz
+    return t, lx, ly
+
+def intersect_quad(surface:RenderSurface, ray:Ray):
+    ''' returns ray t of intersection of ray with quad surface; otherwise returns None '''
+    hit = _intersect_plane(surface, ray)
+    if hit is None:
+        return None
+    t,lx,ly = hit
+    r = surface.radius
+    if abs(lx) > r or abs(ly) > r:
+        return None
+    return t
+
+def intersect_circle(surface:RenderSurface, ray:Ray):
+    ''' returns ray t of intersection of ray with circle surface; otherwise returns None '''
+    hit = _intersect_plane(surface, ray)
+    if hit is None:
+        return None
+    t,lx,ly = hit
+    if lx * lx + ly * ly > surface.radius2:
+        return None
+    return t
+
+# intersection functions indexed by RenderSurface.kind
+intersect_surface_typed = {
+    SURFACE_SPHERE: intersect_sphere,
+    SURFACE_QUAD:   intersect_quad,
+    SURFACE_CIRCLE: intersect_circle,
+}
+
+def intersect_surface(surface:RenderSurface, ray:Ray):
+    ''' returns ray t of intersection of ray with surface (not checked against ray min/max); otherwise returns None '''
+    return intersect_surface_typed[surface.kind](surface, ray)
+
+
+# RenderStats of tile being rendered by this process, or None when stats are not collected
+# (the functions below only count when it is set; see `_raytrace_tile_stats`)
+tile_stats = None
+
+def _intersect_surface_counted(surface:RenderSurface, ray:Ray):
+    ''' intersect_surface, counting the test in tile_stats '''
+    tile_stats.tests[surface.kind] += 1
+    return intersect_surface_typed[surface.kind](surface, ray)
+
+def _traverse_counted(traverse, ray:Ray, surfaces):
+    ''' returns traverse(ray, surfaces, ...) (BVH.closest or BVH.any_hit), counting tests and time in tile_stats '''
+    time_beg = time.perf_counter()
+    hit = traverse(ray, surfaces, _intersect_surface_counted)
+    tile_stats.traversal_time += time.perf_counter() - time_beg
+    return hit
+
+
+def intersect(scene:RenderScene, ray:Ray):
+    ''' returns closest intersection of ray with scene; otherwise returns None '''
 
     '''
-    foreach surface
-        if surface is a quad
-            compute ray intersection (and ray_t), continue if not hit
-            check if computed ray_t is between min and max, continue if not
-            check if this is closest intersection, continue if not
-            record hit information
-        if surface is a sphere
+    traverse scene's BVH front-to-back (see common/bvh.py)
+        skip node if its box is entered beyond closest intersection
+        foreach surface in leaf
             compute ray intersection (and ray_t), continue if not hit
             check if computed ray_t is between min and max, continue if not
             check if this is closest intersection, continue if not
@@ -71,60 +186,45 @@ def intersect(scene:Scene, ray:Ray):
     return closest intersection
     '''
 
-    intersection = None
-
-    for surface in scene.surfaces:
-        o = surface.frame.o
-        r = surface.radius
-        if surface.is_quad:
-            n = surface.frame.z
-            t = (o - ray.e).dot(n) / ray.d.dot(n)
-            p = ray.eval(t)
-            p_ = surface.frame.w2l_point(p)
-            if abs(p_.x) > r or abs(p_.y) > r:
-                continue
-        elif surface.is_circle:
-            n = surface.frame.z
-            t = (o - ray.e).dot(n) / ray.d.dot(n)
-            p = ray.eval(t)
-            p_ = surface.frame.w2l_point(p)
-            if (p_.x ** 2 + p_.y ** 2) > r ** 2:
-                continue
-        else:
-            b = 2 * ray.d.dot(ray.e - o)
-            c = (ray.e - o).length_squared - r * r
-            d = b * b - 4 * c
-            if d < 0:
-                continue
-            t = (-b - math.sqrt(d)) / 2
-
-        if not ray.valid_t(t):
-            continue
-
-        if intersection is None or t <= intersection.ray_t:
-            p = ray.eval(t)
-            n = Ray.from_segment_no_max(o, p).d
-            if surface.is_quad:
-                n = surface.frame.z
-            f = Frame(o=p, z=n)
-            m = surface.material
-            intersection = Intersection(t, f, m)
-
-    return intersection
-
-def irradiance(scene:Scene, ray:Ray, iterations=0):
+    if tile_stats is None:
+        hit = scene.bvh.closest(ray, scene.surfaces, intersect_surface)
+    else:
+        hit = _traverse_counted(scene.bvh.closest, ray, scene.surfaces)
+        tile_stats.hits += hit is not None
+    if hit is None:
+        return None
+
+    t, surface = hit
+    p = ray.eval(t)
+    if surface.kind == SURFACE_QUAD:
+        n = surface.z
+    else:
+        n = Direction(p - surface.o)
+    return Intersection(t, p, n, surface.material, surface)
+
+def occluded(scene:RenderScene, ray:Ray):
+    ''' returns True if any surface in scene is hit by ray between its min and max; otherwise returns False '''
+    if tile_stats is None:
+        return scene.bvh.any_hit(ray, scene.surfaces, intersect_surface)
+    blocked = _traverse_counted(scene.bvh.any_hit, ray, scene.surfaces)
+    tile_stats.shadow_rays += 1
+    tile_stats.occluded += blocked
+    return blocked
+
+def irradiance(scene:RenderScene, ray:Ray, iterations=0, throughput:Vector=None):
     ''' computes irradiance (color) from scene along ray (reversed) '''
 
     '''
     get scene intersection
     if not hit, return background
+    shade intersection:
     accumulate color starting with ambient
     foreach light
         compute light response
         compute light direction
         compute material response (BRDF*cos)
         check for shadows and accumulate if needed
-    if material has reflections
+    if bounces remain and reflected light would contribute (throughput above cutoff)
         create reflection ray
         accumulate reflected light (recursive call) scaled by material reflection
     return accumulated color
@@ -133,15 +233,27 @@ def irradiance(scene:Scene, ray:Ray, iterations=0):
     intersection = intersect(scene, ray)
     if not intersection:
         return scene.background
+    return shade(scene, ray, intersection, iterations, throughput)
+
+# number of reflection rays not traced because their throughput was at or below scene.reflection_cutoff
+reflection_rays_skipped = 0
+
+def shade(scene:RenderScene, ray:Ray, intersection:Intersection, iterations=0, throughput:Vector=None):
+    '''
+    computes irradiance (color) leaving intersection of ray with scene toward ray origin
+    iterations is the number of reflection bounces before ray; throughput is the product
+    of reflection coefficients along those bounces (None for camera rays)
+    '''
+    global reflection_rays_skipped
 
     final_color = Vector((0, 0, 0))
     final_color += scene.ambient * intersection.mat.kd
     for light in scene.lights:
-        s = light.frame.o
-        p = intersection.frame.o
-        n = intersection.frame.z
+        s = light.o
+        p = intersection.pos
+        n = intersection.normal
         ray_to_light = Ray.from_segment(p, s)
-        if intersect(scene, ray_to_light):
+        if occluded(scene, ray_to_light):
             continue
         if light.is_point:
             response = light.intensity / (s - p).length_squared
@@ -151,37 +263,104 @@ def irradiance(scene:Scene, ray:Ray, iterations=0):
             final_color += response * (intersection.mat.kd + intersection.mat.ks * max(0, n.dot(h)) ** intersection.mat.n) * max(0, (n.dot(direction)))
         else:
             response = light.intensity
-            direction = light.frame.z
+            direction = light.z
             h = (ray_to_light.d + -ray.d)
             h /= h.length
             final_color += response * (intersection.mat.kd + intersection.mat.ks * max(0, n.dot(h)) ** intersection.mat.n) * max(0, (n.dot(direction)))
 
-    v = -ray.d
-    n = intersection.frame.z
-    rd = -v + 2 * (v.dot(n)) * n
-    r = Ray(intersection.frame.o, rd)
-    if iterations < 2:
-        final_color += intersection.mat.kr * irradiance(scene, r, 5)
+    if iterations < scene.max_bounces:
+        kr = intersection.mat.kr
+        throughput = kr if throughput is None else throughput * kr
+        if max(throughput) > scene.reflection_cutoff:
+            v = -ray.d
+            n = intersection.normal
+            rd = -v + 2 * (v.dot(n)) * n
+            r = Ray.from_normalized(intersection.pos, Direction(rd))
+            if tile_stats is not None: tile_stats.reflection_rays += 1
+            final_color += kr * irradiance(scene, r, iterations + 1, throughput)
+        else:
+            reflection_rays_skipped += 1
 
     return final_color
 
 
-@timed_call('raytrace') # <= reports how long this function took
-def raytrace(scene:Scene):
-    ''' computes image of scene using raytracing '''
+def camera_ray(scene:RenderScene, col:int, row:int, col2:int=0, row2:int=0, samples:int=1):
+    ''' returns camera ray through sample (col2,row2) of a samples x samples grid in pixel (col,row) '''
+    cam = scene.camera
+    u = (col + (col2 + 0.5) / samples) / scene.resolution_width
+    v = 1 - (row + (row2 + 0.5) / samples) / scene.resolution_height
+    q = cam.frame.o + (u - 0.5) * cam.width * cam.frame.x + (v - 0.5) * cam.height * cam.frame.y - (cam.dist * cam.frame.z)
+    return Ray.from_segment_no_max(cam.frame.o, q)
 
-    image = Image(scene.resolution_width, scene.resolution_height)
+
+def adaptive_pixel(scene:RenderScene, col:int, row:int, samples:int, threshold:float):
+    '''
+    computes color of pixel (col,row) using adaptive anti-aliasing, returning (color, number of samples)
+
+    The four corner samples of the samples x samples grid are traced
+    first.  If their colors differ by more than threshold in any channel
+    or they hit different surfaces, the remaining samples are traced and
+    all samples are averaged (exactly as non-adaptive anti-aliasing does);
+    otherwise the corner samples are averaged.
+    '''
+    corners = {}
+    surfaces = set()
+    for col2 in (0, samples - 1):
+        for row2 in (0, samples - 1):
+            r = camera_ray(scene, col, row, col2, row2, samples)
+            intersection = intersect(scene, r)
+            if intersection:
+                corners[col2, row2] = shade(scene, r, intersection)
+                surfaces.add(id(intersection.surface))
+            else:
+                corners[col2, row2] = scene.background
+                surfaces.add(None)
+
+    colors = list(corners.values())
+    refine = len(surfaces) > 1
+    for c in range(3):
+        if refine: break
+        vals = [color[c] for color in colors]
+        refine = max(vals) - min(vals) > threshold
+
+    if not refine:
+        color = Vector((0, 0, 0))
+        for corner in colors:
+            color += corner
+        return color / len(colors), len(colors)
+
+    color = Vector((0, 0, 0))
+    for col2 in range(samples):
+        for row2 in range(samples):
+            if (col2, row2) in corners:
+                color += corners[col2, row2]
+            else:
+                color += irradiance(scene, camera_ray(scene, col, row, col2, row2, samples))
+    return color / (samples ** 2), samples ** 2
+
+
+def raytrace_tile(scene:RenderScene, tile, options:RenderOptions=None):
+    '''
+    computes pixels of tile (col0,row0,col1,row1) of image of scene using raytracing
+    returns (pixels, counts), where pixels is list of rows (row0 to row1-1) in
+    "boxed row flat pixel" format (see Image), and counts is dict with number of
+    camera rays traced and reflection rays skipped
+    '''
 
     '''
     if no anti-aliasing
-        foreach image row (scene.resolution_height)
-            foreach pixel in row (scene.resolution_width)
+        foreach image row in tile
+            foreach pixel in row of tile
                 compute ray-camera parameters (u,v) for pixel
                 compute camera ray
                 set pixel to color raytraced with ray
+    else if adaptive anti-aliasing
+        foreach image row in tile
+            foreach pixel in row of tile
+                set pixel to color of adaptive_pixel
     else
-        foreach image row
-            foreach pixel in row
+        foreach image row in tile
+            foreach pixel in row of tile
                 init accumulated color
                 foreach sample in y
                     foreach sample in x
@@ -189,9 +368,16 @@ def raytrace(scene:Scene):
                         computer camera ray
                         accumulate color raytraced with ray
                 set pixel to accum color scaled by number of samples
-    return rendered image
+    return rendered pixels
     '''
 
+    options = options or RenderOptions()
+    if options.stats and tile_stats is None:
+        return _raytrace_tile_stats(scene, tile, options)
+    if options.engine == ENGINE_FAST:
+        return kernels.raytrace_tile(scene, tile, options)
+    col0, row0, col1, row1 = tile
+
     o = scene.camera.frame.o
     x = scene.camera.frame.x
     y = scene.camera.frame.y
@@ -200,18 +386,26 @@ def raytrace(scene:Scene):
     h = scene.camera.height
     d = scene.camera.dist
 
-    if scene.pixel_samples == 1:
-        for row in range(scene.resolution_height):
-            for col in range(scene.resolution_width):
+    samples = options.aa_max_samples or scene.pixel_samples
+    adaptive = options.adaptive_aa and samples > 1
+
+    skipped_before = reflection_rays_skipped
+    pixels = []
+    num_samples = 0
+    for row in range(row0, row1):
+        pixels_row = []
+        for col in range(col0, col1):
+            if adaptive:
+                color, n = adaptive_pixel(scene, col, row, samples, options.aa_threshold)
+                num_samples += n
+            elif scene.pixel_samples == 1:
                 u = (col + 0.5) / (scene.resolution_width)
                 v = 1 - ((row + 0.5) / (scene.resolution_height))
                 q = o + (u - 0.5) * w * x + (v - 0.5) * h * y - (d * z)
                 r = Ray.from_segment_no_max(o, q)
-                image[col, row] = irradiance(scene, r)
-
-    elif scene.pixel_samples > 1:
-        for col in range(scene.resolution_width):
-            for row in range(scene.resolution_height):
+                color = irradiance(scene, r)
+                num_samples += 1
+            else:
                 color = Vector((0, 0, 0))
                 for col2 in range(scene.pixel_samples):
                     for row2 in range(scene.pixel_samples):
@@ -220,17 +414,432 @@ def raytrace(scene:Scene):
                         q = o + (u - 0.5) * w * x + (v - 0.5) * h * y - (d * z)
                         r = Ray.from_segment_no_max(o, q)
                         color += irradiance(scene, r)
-                image[col, row] = color / (scene.pixel_samples ** 2)
+                color = color / (scene.pixel_samples ** 2)
+                num_samples += scene.pixel_samples ** 2
+            pixels_row += [color.x, color.y, color.z, 1]
+        pixels.append(pixels_row)
+    counts = {
+        'camera_rays': num_samples,
+        'reflection_rays_skipped': reflection_rays_skipped - skipped_before,
+    }
+    return pixels, counts
+
+
+def _raytrace_tile_stats(scene:RenderScene, tile, options:RenderOptions):
+    '''
+    raytrace_tile, collecting RenderStats of tile, which are returned in counts['stats']
+
+    Ray generation is timed separately, by generating the tile's camera rays
+    again (without tracing them), and shading time is the rest of the tile's
+    time not spent in traversal.
+    '''
+    global tile_stats
+    stats = RenderStats()
+    fast = options.engine == ENGINE_FAST
+    if fast:
+        scene = kernels.prepare(scene)
+        scene.stats = stats
+    tile_stats = stats
+    time_beg = time.perf_counter()
+    try:
+        pixels, counts = raytrace_tile(scene, tile, options)
+    finally:
+        tile_stats = None
+        if fast: scene.stats = None
+    time_tile = time.perf_counter() - time_beg
+
+    stats.camera_rays = counts['camera_rays']
+    stats.reflection_rays_skipped = counts['reflection_rays_skipped']
+    if fast:
+        stats.ray_gen_time = kernels.time_camera_rays(scene, tile, options, stats.camera_rays)
+    else:
+        stats.ray_gen_time = time_camera_rays(scene, tile, options, stats.camera_rays)
+    stats.shading_time = max(0.0, time_tile - stats.ray_gen_time - stats.traversal_time)
+    counts['stats'] = stats
+    return pixels, counts
+
+def time_camera_rays(scene:RenderScene, tile, options:RenderOptions, num_rays:int):
+    ''' returns estimated seconds to generate num_rays camera rays of tile, timed by generating each sample's camera ray once '''
+    col0, row0, col1, row1 = tile
+    samples = (options.aa_max_samples or scene.pixel_samples) if options.adaptive_aa else scene.pixel_samples
+    time_beg = time.perf_counter()
+    for row in range(row0, row1):
+        for col in range(col0, col1):
+            for col2 in range(samples):
+                for row2 in range(samples):
+                    camera_ray(scene, col, row, col2, row2, samples)
+    generated = (row1 - row0) * (col1 - col0) * samples * samples
+    return (time.perf_counter() - time_beg) * num_rays / max(1, generated)
+
+
+def image_tiles(width:int, height:int, tile_size:int):
+    ''' returns list of tiles (col0,row0,col1,row1) covering image, in row-major order '''
+    return [
+        (col0, row0, min(col0 + tile_size, width), min(row0 + tile_size, height))
+        for row0 in range(0, height, tile_size)
+        for col0 in range(0, width, tile_size)
+    ]
+
+
+def estimate_tile_costs(scene:RenderScene, tiles, samples:int):
+    '''
+    returns predicted relative cost of rendering each tile, measured as the time to
+    trace a low-res grid of samples x samples camera rays spread over the tile
+    '''
+    o = scene.camera.frame.o
+    x = scene.camera.frame.x
+    y = scene.camera.frame.y
+    z = scene.camera.frame.z
+    w = scene.camera.width
+    h = scene.camera.height
+    d = scene.camera.dist
+
+    costs = []
+    for col0, row0, col1, row1 in tiles:
+        time_beg = time.perf_counter()
+        for i in range(samples):
+            for j in range(samples):
+                u = (col0 + (col1 - col0) * (i + 0.5) / samples) / scene.resolution_width
+                v = 1 - (row0 + (row1 - row0) * (j + 0.5) / samples) / scene.resolution_height
+                q = o + (u - 0.5) * w * x + (v - 0.5) * h * y - (d * z)
+                irradiance(scene, Ray.from_segment_no_max(o, q))
+        costs.append(time.perf_counter() - time_beg)
+    return costs
+
+
+# scene, options, and shared image (or None) of pool worker process, set once per worker by _init_worker
+_worker_scene = None
+_worker_options = None
+_worker_image = None
+
+def _init_worker(scene:RenderScene, options:RenderOptions, image_args, tracing:bool):
+    global _worker_scene, _worker_options, _worker_image
+    if tracing: trace.start('worker')
+    with trace.span('worker init'):
+        # the fast engine's flattened scene is built once per worker, not once per tile
+        _worker_scene = kernels.prepare(scene) if options.engine == ENGINE_FAST else scene
+        _worker_options = options
+        if image_args:
+            width, height, name, typecode = image_args
+            _worker_image = SharedImage(width, height, name=name, typecode=typecode)
+            # detach when the worker exits (worker processes do not run atexit handlers)
+            multiprocessing.util.Finalize(None, _worker_image.close, exitpriority=10)
+
+def _raytrace_tile_worker(tile):
+    with trace.span('tile', tile=list(tile)):
+        pixels, counts = raytrace_tile(_worker_scene, tile, _worker_options)
+        if _worker_image is not None:
+            # write pixels in place, so only the tile is sent back
+            col0, row0, _, _ = tile
+            for row, pixels_row in enumerate(pixels, row0):
+                _worker_image.set_row((col0, row), pixels_row)
+            pixels = None
+    if trace.enabled():
+        counts['trace'] = trace.take()
+    return tile, pixels, counts
+
+def _raytrace_tile_traced(scene:RenderScene, tile, options:RenderOptions):
+    ''' raytrace_tile, recorded as a span of the trace '''
+    with trace.span('tile', tile=list(tile)):
+        return raytrace_tile(scene, tile, options)
+
+
+@timed_call('raytrace') # <= reports how long this function took
+def raytrace(scene:Scene, options:RenderOptions=None, stats:RenderStats=None):
+    '''
+    computes image of scene (Scene or RenderScene) using raytracing
 
+    With options.workers > 1, the image is split into tiles that are
+    rendered by a pool of worker processes.  The scene is sent once to
+    each worker (pool initializer), and every pixel is computed exactly
+    as it is with a single worker, so output does not depend on worker
+    count.
+
+    Tiles are handed out by a work-stealing scheduler in order of cost
+    predicted by a low-res pre-pass (options.scheduler = 'steal'), or in
+    row-major order by a multiprocessing.Pool ('pool').
+
+    With options.shared_framebuffer, workers write pixels in place into
+    a SharedImage that is returned (saving it reads the shared block
+    directly, so the frame is never copied).  `image.close()` frees the
+    block; it is also freed if the image is garbage collected.
+
+    With options.stats, statistics of the render are added into stats
+    (RenderStats), if given (see `render_with_stats`).
+    '''
+
+    options = options or RenderOptions()
+    scene = compile_scene(scene)
+    time_beg = time.perf_counter()
+    if options.engine == ENGINE_NUMPY:
+        image, counts = _raytrace_wavefront(scene, options)
+        _report(options, None, counts, None, stats, time_beg)
+        return image
+
+    width, height = scene.resolution_width, scene.resolution_height
+    pool = scheduler = None
+
+    if options.workers <= 1:
+        image = Image(width, height)
+        tiles = [(0, 0, width, height)]
+        results = ((tile,) + _raytrace_tile_traced(scene, tile, options) for tile in tiles)
+    else:
+        if options.shared_framebuffer:
+            image = SharedImage(width, height, typecode='f' if options.framebuffer_float32 else 'd')
+            image_args = (width, height, image.name, image.typecode)
+        else:
+            image = Image(width, height)
+            image_args = None
+        tiles = image_tiles(width, height, options.tile_size)
+        if options.scheduler == SCHEDULER_POOL:
+            costs = None
+        else:
+            with trace.span('estimate tile costs', tiles=len(tiles)):
+                costs = estimate_tile_costs(scene, tiles, options.prepass_samples)
+        results, pool, scheduler = _tile_results(scene, options, tiles, costs, image_args)
+
+    counts = {}
+    try:
+        for (col0, row0, col1, row1), pixels, tile_counts in results:
+            _add_counts(counts, tile_counts)
+            if pixels is None: continue     # written in place by worker
+            for row, pixels_row in enumerate(pixels, row0):
+                image.set_row((col0, row), pixels_row)
+    except:
+        if pool: pool.terminate()
+        image.close()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    _report(options, scheduler, counts, width * height, stats, time_beg)
     return image
 
 
-if len(sys.argv) < 2:
-    print('Usage: %s <path/to/scenefile0.json> [path/to/scenefile1.json] [...]' % sys.argv[0])
-    sys.exit(1)
+def _raytrace_wavefront(scene:RenderScene, options:RenderOptions):
+    ''' returns (image, counts) of scene rendered by the numpy engine, with RenderStats in counts['stats'] if options.stats '''
+    counts = {}
+    stats = RenderStats() if options.stats else None
+    image = raytrace_wavefront(scene, counts, stats)
+    if stats is not None:
+        stats.reflection_rays_skipped = counts.get('reflection_rays_skipped', 0)
+        counts['stats'] = stats
+    return image, counts
+
+def _tile_results(scene:RenderScene, options:RenderOptions, tiles, costs, image_args):
+    '''
+    starts rendering tiles across options.workers worker processes, returning (results, pool, scheduler),
+    where results yields (tile, pixels, counts) in completion order, and pool (SCHEDULER_POOL) or
+    scheduler (SCHEDULER_STEAL, tiles in order of costs if given) is the one used, the other None
+    '''
+    if options.scheduler == SCHEDULER_POOL:
+        pool = multiprocessing.Pool(options.workers, initializer=_init_worker, initargs=(scene, options, image_args, trace.enabled()))
+        return pool.imap_unordered(_raytrace_tile_worker, tiles), pool, None
+    scheduler = TileScheduler(options.workers, _raytrace_tile_worker, initializer=_init_worker, initargs=(scene, options, image_args, trace.enabled()))
+    return scheduler.run(tiles, costs), None, scheduler
+
+def _add_counts(counts, tile_counts):
+    ''' adds counts of a tile into counts of render (RenderStats are added, trace events of workers go to the trace, others summed) '''
+    for k, v in tile_counts.items():
+        if k == 'stats':
+            counts.setdefault(k, RenderStats()).add(v)
+        elif k == 'trace':
+            trace.add(v)
+        else:
+            counts[k] = counts.get(k, 0) + v
 
+def _report(options:RenderOptions, scheduler, counts, num_pixels:int, stats:RenderStats, time_beg:float):
+    '''
+    prints scheduler report (if any) and adaptive samples per pixel, and adds counted
+    stats (if any) into stats, with render time since time_beg (other counts, ex: reflection
+    rays skipped, are only reported through stats, see `_render_scene_file`)
+    '''
+    if scheduler:
+        for line in scheduler.report():
+            print(line)
+    if options.adaptive_aa and num_pixels:
+        print('Samples: %0.2f per pixel (adaptive)' % (counts['camera_rays'] / num_pixels))
+    if stats is not None and 'stats' in counts:
+        stats.add(counts['stats'])
+        stats.render_time += time.perf_counter() - time_beg
+
+
+def raytrace_rows(scene:Scene, options:RenderOptions=None, stats:RenderStats=None):
+    '''
+    computes image of scene (Scene or RenderScene) like `raytrace`, but yields
+    its rows top to bottom (each a list of width*4 RGBA floats) as soon as they
+    are completed, instead of returning an Image
+
+    Tiles finish in any order, so the rows of a band of tiles are held until
+    every tile of the band, and every band above it, is done.  To keep few
+    bands in memory, tiles are handed out in row-major order (no cost pre-pass)
+    and workers always send pixels back (no shared framebuffer).  With one
+    worker, each row is its own tile.  The numpy engine renders all pixels at
+    once, so its rows are only yielded at the end.
+
+    With options.stats, statistics are added into stats as in `raytrace`,
+    once all rows are yielded; render time includes time spent by the
+    consumer of the rows (ex: writing them to a file).
+    '''
 
-for scene_filename in sys.argv[1:]:
+    options = options or RenderOptions()
+    scene = compile_scene(scene)
+    time_beg = time.perf_counter()
+    if options.engine == ENGINE_NUMPY:
+        image, counts = _raytrace_wavefront(scene, options)
+        _report(options, None, counts, None, stats, time_beg)
+        yield from image.iter_rows()
+        return
+
+    width, height = scene.resolution_width, scene.resolution_height
+    pool = scheduler = None
+
+    if options.workers <= 1:
+        tiles = [(0, row, width, row + 1) for row in range(height)]
+        # the fast engine's flattened scene is built once, not once per row
+        tile_scene = kernels.prepare(scene) if options.engine == ENGINE_FAST else scene
+        results = ((tile,) + _raytrace_tile_traced(tile_scene, tile, options) for tile in tiles)
+    else:
+        tiles = image_tiles(width, height, options.tile_size)
+        results, pool, scheduler = _tile_results(scene, options, tiles, None, None)
+
+    # row0 of band => [number of tiles of band not done, rows of band (or None)]
+    bands = {}
+    for _, row0, _, _ in tiles:
+        bands.setdefault(row0, [0, None])[0] += 1
+    next_row = 0
+    counts = {}
+    try:
+        for (col0, row0, col1, row1), pixels, tile_counts in results:
+            _add_counts(counts, tile_counts)
+            band = bands[row0]
+            if band[1] is None:
+                band[1] = [[0.0] * (width * 4) for row in range(row0, row1)]
+            for band_row, pixels_row in zip(band[1], pixels):
+                band_row[col0 * 4:col1 * 4] = pixels_row
+            band[0] -= 1
+            while next_row in bands and bands[next_row][0] == 0:
+                _, rows = bands.pop(next_row)
+                yield from rows
+                next_row += len(rows)
+    except:
+        if pool: pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    _report(options, scheduler, counts, width * height, stats, time_beg)
+
+@timed_call('raytrace') # <= reports how long this function took
+def raytrace_to_file(scene:Scene, filename:str, options:RenderOptions=None, stats:RenderStats=None):
+    '''
+    computes image of scene (Scene or RenderScene) using raytracing, writing it to
+    PNG file filename row by row as rows are completed (see `raytrace_rows`)
+    with options.stats, statistics are added into stats (if given), where save time
+    is the time spent writing rows, and render time the time spent computing them
+    '''
+    options = options or RenderOptions()
+    scene = compile_scene(scene)
+    render_stats = RenderStats() if options.stats and stats is not None else None
+    rows = raytrace_rows(scene, options, render_stats)
+    if render_stats is not None:
+        elapsed = [0.0]
+        rows = _timed_rows(rows, elapsed)
+        time_beg = time.perf_counter()
+    save_rows(filename, scene.resolution_width, scene.resolution_height, rows,
+              compression=options.png_compression, compression_threads=options.png_threads)
+    if render_stats is not None:
+        render_stats.render_time = elapsed[0]
+        render_stats.save_time = time.perf_counter() - time_beg - elapsed[0]
+        stats.add(render_stats)
+
+def _timed_rows(rows, elapsed):
+    ''' yields rows, adding seconds spent computing them to elapsed[0] '''
+    rows = iter(rows)
+    while True:
+        time_beg = time.perf_counter()
+        row = next(rows, None)
+        elapsed[0] += time.perf_counter() - time_beg
+        if row is None: return
+        yield row
+
+
+def render(scene:Scene, options:RenderOptions=None, stats:RenderStats=None):
+    '''
+    renders scene (Scene or RenderScene) with options, returning the Image
+    with options.stats, statistics of the render are added into stats (if given)
+
+    This is the library entry point: importing this module has no side
+    effects, so it can be used from other programs and worker processes.
+    Call `image.close()` when done with the returned image to free it
+    right away (with several workers it is a SharedImage; otherwise
+    close does nothing); it is also freed when garbage collected.
+    '''
+    return raytrace(scene, options, stats)
+
+def render_with_stats(scene:Scene, options:RenderOptions=None):
+    ''' renders scene (Scene or RenderScene) with options (and stats on), returning (Image, RenderStats) '''
+    options = copy.copy(options or RenderOptions())
+    options.stats = True
+    stats = RenderStats()
+    return render(scene, options, stats), stats
+
+def render_file(scene_filename:str, options:RenderOptions=None, stats:RenderStats=None):
+    ''' loads scene from scene file and renders it with options, returning the Image '''
+    return render(scene_from_file(scene_filename), options, stats)
+
+def render_file_to_file(scene_filename:str, image_filename:str, options:RenderOptions=None, stats:RenderStats=None):
+    ''' loads scene from scene file and renders it with options, streaming rows into PNG file image_filename '''
+    raytrace_to_file(scene_from_file(scene_filename), image_filename, options, stats)
+
+
+def parse_args(argv=None):
+    ''' returns (scene filenames, RenderOptions) parsed from command line arguments '''
+    defaults = RenderOptions()
+    parser = argparse.ArgumentParser(description='Raytraces each scene file, writing image next to it (.json => .png)')
+    parser.add_argument('scenes', metavar='path/to/scenefile.json', nargs='+', help='scene file(s) to render')
+    parser.add_argument('--engine', choices=ENGINES, default=defaults.engine, help='render engine (default: %(default)s)')
+    parser.add_argument('--workers', metavar='N', type=int, default=defaults.workers, help='number of worker processes (scalar and fast engines; default: %(default)s)')
+    parser.add_argument('--tile-size', metavar='PIXELS', type=int, default=defaults.tile_size, help='size of tiles rendered by workers (default: %(default)s)')
+    parser.add_argument('--scheduler', choices=SCHEDULERS, default=defaults.scheduler, help='how tiles are distributed to workers (default: %(default)s)')
+    parser.add_argument('--no-shared-framebuffer', action='store_true', help='workers send pixels back to main process instead of writing to shared memory')
+    parser.add_argument('--float32-framebuffer', action='store_true', help='store shared framebuffer as float32 (half memory; may not match float64 renders exactly)')
+    parser.add_argument('--adaptive-aa', action='store_true', help='refine anti-aliasing only where corner samples differ (scalar and fast engines)')
+    parser.add_argument('--aa-threshold', metavar='T', type=float, default=defaults.aa_threshold, help='max channel difference of corner samples before refining (default: %(default)s)')
+    parser.add_argument('--aa-max-samples', metavar='N', type=int, default=defaults.aa_max_samples, help='samples per pixel in x and y when refining (default: scene pixel_samples)')
+    parser.add_argument('--stream', action='store_true', help='write rows to the image file as they are completed instead of keeping the whole image in memory')
+    parser.add_argument('--png-compression', metavar='LEVEL', type=int, choices=range(-1, 10), default=defaults.png_compression, help='zlib level of image file, 0 (fastest) to 9 (smallest), -1: zlib default (default: %(default)s)')
+    parser.add_argument('--png-threads', metavar='N', type=int, default=defaults.png_threads, help='threads compressing the image file (default: %(default)s)')
+    parser.add_argument('--stats', action='store_true', help='count rays, intersection tests, and time of each phase, and print a summary')
+    parser.add_argument('--stats-json', metavar='FILE', help='also write stats of each scene to JSON file (implies --stats)')
+    parser.add_argument('--trace', metavar='FILE', help='write trace of scene loading, tiles, image encoding, ... of all processes to FILE (Chrome trace-event JSON)')
+    args = parser.parse_args(argv)
+
+    options = RenderOptions()
+    options.engine = args.engine
+    options.workers = args.workers
+    options.tile_size = args.tile_size
+    options.scheduler = args.scheduler
+    options.shared_framebuffer = not args.no_shared_framebuffer
+    options.framebuffer_float32 = args.float32_framebuffer
+    options.adaptive_aa = args.adaptive_aa
+    options.aa_threshold = args.aa_threshold
+    options.aa_max_samples = args.aa_max_samples
+    options.stream = args.stream
+    options.png_compression = args.png_compression
+    options.png_threads = args.png_threads
+    options.stats = args.stats or args.stats_json is not None
+    options.stats_json = args.stats_json
+    options.trace = args.trace
+    return args.scenes, options
+
+
+def _render_scene_file(scene_filename:str, options:RenderOptions):
+    ''' renders scene file, writing image next to it (.json => .png), returning RenderStats (or None) '''
     base,_ = os.path.splitext(scene_filename)
     image_filename = '%s.png' % base
 
@@ -238,10 +847,42 @@ for scene_filename in sys.argv[1:]:
     print('Writing image: %s' % image_filename)
 
     print('Raytracing...')
-    scene = scene_from_file(scene_filename)
-    image = raytrace(scene)
-    image.save(image_filename)
-
-
-print('Done')
-print()
+    stats = RenderStats() if options.stats else None
+    if options.stream:
+        render_file_to_file(scene_filename, image_filename, options, stats)
+    else:
+        image = render_file(scene_filename, options, stats)
+        time_beg = time.perf_counter()
+        image.save(image_filename, compression=options.png_compression, compression_threads=options.png_threads)
+        if stats is not None: stats.save_time = time.perf_counter() - time_beg
+        image.close()
+    if stats is not None:
+        for line in stats.summary():
+            print(line)
+    return stats
+
+def main(argv=None):
+    scene_filenames, options = parse_args(argv)
+    if options.trace: trace.start()
+
+    all_stats = {}
+    for scene_filename in scene_filenames:
+        with trace.span('scene', file=scene_filename):
+            stats = _render_scene_file(scene_filename, options)
+        if stats is not None:
+            all_stats[scene_filename] = stats.as_dict()
+
+    if options.stats_json:
+        with open(options.stats_json, 'wt') as f:
+            json.dump(all_stats, f, indent=2)
+        print('Wrote stats: %s' % options.stats_json)
+    if options.trace:
+        trace.write(options.trace)
+        print('Wrote trace: %s' % options.trace)
+
+    print('Done')
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.maths import Point, Direction, Frame
+
+'''
+Micro-benchmark of Frame construction.
+
+The renderer builds a Frame for shading (origin plus normal) and every
+time a Camera or Light is moved, so construction cost matters.  This
+times the default frame, the generic origin+z constructor, and (if
+available) the fast `Frame.from_z` constructor.
+
+usage: python3 benchmarks/frame_construction.py [count]
+'''
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 200000
+
+    o = Point((1.0, 2.0, 3.0))
+    z = Direction((0.3, -0.5, 0.8))
+
+    cases = [
+        ('Frame()',           lambda: Frame()),
+        ('Frame(o=o, z=z)',   lambda: Frame(o=o, z=z)),
+    ]
+    if hasattr(Frame, 'from_z'):
+        cases.append(('Frame.from_z(o, z)', lambda: Frame.from_z(o, z)))
+
+    for label,fn in cases:
+        best = min(timeit.repeat(fn, number=count, repeat=5))
+        print('%-20s %8.3f us/frame' % (label, best / count * 1e6))
+
+if __name__ == '__main__':
+    main()
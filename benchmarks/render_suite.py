@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import glob
+import time
+import queue as queue_module
+import argparse
+import platform
+import resource
+import contextlib
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import P02_Raytrace as raytracer
+from common.scene import scene_from_file, compile_scene
+from common.options import RenderOptions, ENGINES, SCHEDULERS
+
+'''
+Render benchmark suite.
+
+Renders every scene (default: scenes/*.json; pass scene files or
+directories, ex: of synthetic scenes, to render others) `repeat` times
+with the given render options, and records for each scene the wall time
+of each render, camera rays per second (of the fastest render), and the
+peak RSS of the largest single process into a JSON results file, along with the render options and machine.
+Scene loading and saving are not timed, and compiling the scene (which
+builds its BVH) is timed separately (setup).
+
+Each render runs in a fresh process, so no render warms up the next.
+The RSS recorded is the largest peak of any single process of the
+render (the render process or one of its workers), not the sum over
+processes: the kernel reports only the largest peak among children.  A
+scene that fails to render (ex: malformed scene file) is reported with
+its error and counts as a failure; the other scenes still run.
+
+With --baseline, results are compared against an earlier results file:
+a scene whose best wall time is more than `tolerance` slower than its
+baseline is flagged as a regression, and the exit status is 1.
+
+usage: python3 benchmarks/render_suite.py [scenes...] [--repeat N] [--output FILE]
+           [--baseline FILE] [--tolerance T] [--engine E] [--workers N] ...
+'''
+
+
+DEFAULT_SCENES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenes')
+
+
+def scene_files(paths):
+    ''' returns sorted list of scene files in paths (files, or directories of *.json) '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.json')))
+        else:
+            files.append(path)
+    return files
+
+def camera_rays(scene):
+    ''' returns number of camera rays traced to render scene (without adaptive anti-aliasing) '''
+    return scene.resolution_width * scene.resolution_height * scene.pixel_samples ** 2
+
+def _render_once(scene_filename, options, queue):
+    try:
+        scene = scene_from_file(scene_filename)
+        # keep the raytracer's progress output ('Timing: ...' of raytrace, worker report) out of the suite's table
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            time_beg = time.perf_counter()
+            scene = compile_scene(scene)
+            setup = time.perf_counter() - time_beg
+            time_beg = time.perf_counter()
+            image = raytracer.render(scene, options)
+            wall = time.perf_counter() - time_beg
+            image.close()
+        # ru_maxrss is in KiB on Linux; for children (the worker processes, if any)
+        # it is the peak of the largest one, so this is the largest single process
+        rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        queue.put(('ok', {'setup': setup, 'wall': wall, 'rays': camera_rays(scene), 'max_process_rss_mb': rss / 1024}))
+    except BaseException as e:
+        queue.put(('error', repr(e)))
+
+def render_once(scene_filename, options:RenderOptions, poll_interval=0.5):
+    '''
+    renders scene file with options in a fresh process, returning dict of setup and render wall times, camera rays, and peak RSS of the largest single process
+    raises RuntimeError if the render fails or the process exits without a result (ex: killed)
+    '''
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_render_once, args=(scene_filename, options, queue))
+    proc.start()
+    try:
+        while True:
+            try:
+                kind, result = queue.get(timeout=poll_interval)
+                break
+            except queue_module.Empty:
+                # exited: read once more, in case the result arrived as it exited
+                if proc.exitcode is not None:
+                    try:
+                        kind, result = queue.get(timeout=poll_interval)
+                        break
+                    except queue_module.Empty:
+                        raise RuntimeError('render process exited (exit code %d) without a result' % proc.exitcode)
+    finally:
+        proc.join(poll_interval)
+        if proc.is_alive(): proc.terminate()
+        proc.join()
+    if kind == 'error':
+        raise RuntimeError(result)
+    return result
+
+def run(scene_filenames, options:RenderOptions, repeat:int):
+    ''' returns results (dict of settings and per-scene results) of rendering each scene repeat times '''
+    results = {
+        'settings': {
+            'engine': options.engine,
+            'workers': options.workers,
+            'tile_size': options.tile_size,
+            'scheduler': options.scheduler,
+            'repeat': repeat,
+        },
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scenes': {},
+    }
+    for scene_filename in scene_filenames:
+        name = os.path.splitext(os.path.basename(scene_filename))[0]
+        try:
+            runs = [render_once(scene_filename, options) for _ in range(repeat)]
+        except RuntimeError as e:
+            results['scenes'][name] = {'error': str(e)}
+            print('%-24s FAILED: %s' % (name, e))
+            continue
+        walls = [r['wall'] for r in runs]
+        best = min(walls)
+        results['scenes'][name] = {
+            'walls': walls,
+            'best': best,
+            'setup': min(r['setup'] for r in runs),
+            'rays': runs[0]['rays'],
+            'rays_per_sec': runs[0]['rays'] / best,
+            'max_process_rss_mb': max(r['max_process_rss_mb'] for r in runs),
+        }
+        print('%-24s best %8.3fs  %10.0f rays/s  %7.1f MB max process RSS' % (name, best, runs[0]['rays'] / best, results['scenes'][name]['max_process_rss_mb']))
+    return results
+
+def compare(results, baseline, tolerance:float):
+    ''' prints comparison of best wall times of results against baseline, returning list of names of scenes that regressed '''
+    for k, v in baseline['settings'].items():
+        if k != 'repeat' and results['settings'].get(k) != v:
+            print('Note: baseline %s is %s (now %s)' % (k, v, results['settings'].get(k)))
+    regressions = []
+    for name, result in results['scenes'].items():
+        base = baseline['scenes'].get(name)
+        if 'error' in result:
+            regressions.append(name)
+            print('%-24s FAILED' % name)
+            continue
+        if base is None or 'error' in base:
+            print('%-24s (not in baseline)' % name)
+            continue
+        ratio = result['best'] / base['best']
+        flag = ratio > 1 + tolerance
+        if flag: regressions.append(name)
+        print('%-24s %8.3fs -> %8.3fs  %+6.1f%%%s' % (name, base['best'], result['best'], (ratio - 1) * 100, '  REGRESSION' if flag else ''))
+    return regressions
+
+
+def parse_args(argv=None):
+    defaults = RenderOptions()
+    parser = argparse.ArgumentParser(description='Renders scenes several times, recording timings to a JSON file and comparing them to a baseline')
+    parser.add_argument('scenes', metavar='PATH', nargs='*', default=[DEFAULT_SCENES], help='scene file(s) or directories of scene files (default: scenes/)')
+    parser.add_argument('--repeat', metavar='N', type=int, default=3, help='renders of each scene; the fastest counts (default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE', help='write results to JSON file')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against results JSON file written earlier with --output')
+    parser.add_argument('--tolerance', metavar='T', type=float, default=0.10, help='flag scenes slower than baseline by more than this fraction (default: %(default)s)')
+    parser.add_argument('--engine', choices=ENGINES, default=defaults.engine, help='render engine (default: %(default)s)')
+    parser.add_argument('--workers', metavar='N', type=int, default=defaults.workers, help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--tile-size', metavar='PIXELS', type=int, default=defaults.tile_size, help='size of tiles rendered by workers (default: %(default)s)')
+    parser.add_argument('--scheduler', choices=SCHEDULERS, default=defaults.scheduler, help='how tiles are distributed to workers (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    options = RenderOptions()
+    options.engine = args.engine
+    options.workers = args.workers
+    options.tile_size = args.tile_size
+    options.scheduler = args.scheduler
+    return args, options
+
+def main(argv=None):
+    args, options = parse_args(argv)
+    results = run(scene_files(args.scenes), options, args.repeat)
+    failed = [name for name, result in results['scenes'].items() if 'error' in result]
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'rt') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('%d regression(s): %s' % (len(regressions), ', '.join(regressions)))
+            return 1
+    if failed:
+        print('%d scene(s) failed: %s' % (len(failed), ', '.join(failed)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
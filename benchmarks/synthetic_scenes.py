@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.options import RenderOptions, ENGINES
+from render_suite import render_once
+
+'''
+Synthetic scene generator, for measuring how render time scales with
+the number of surfaces.
+
+`generate_scene` returns scene JSON data (the format read by
+`scene_from_file`) with N spheres, quads, and circles of random size,
+orientation, and color scattered through a cube in front of the camera,
+and M point lights above it.  The cube grows with the number of
+surfaces, so surfaces stay about the same size on screen and density
+(overlap) stays about the same.  The same seed gives the same scene.
+
+With --sweep, scenes with N = 10, 100, ... surfaces (dealt round-robin
+to the kinds in --mix) are generated and rendered (each in a fresh
+process, see render_suite.py), and time per camera ray is reported
+along with the growth exponent between consecutive N: ~1 means time
+grows linearly with N (every ray tests every surface), ~0 means it
+grows logarithmically or slower (ex: a BVH).  Setup (compiling the
+scene and building its BVH) is reported separately and is not included
+in time per ray.
+
+usage: python3 benchmarks/synthetic_scenes.py out.json [--spheres N] [--quads N] [--circles N] [--lights M] ...
+       python3 benchmarks/synthetic_scenes.py --sweep 10,100,1000,10000,100000 [--mix spheres,quads,circles] [--engine E] ...
+'''
+
+
+KINDS = ['spheres', 'quads', 'circles']
+
+
+def _round(v):
+    return [round(c, 6) for c in v]
+
+def _random_frame(rng, o):
+    ''' returns frame JSON data with origin o and random orthonormal axes '''
+    while True:
+        z = [rng.gauss(0, 1) for _ in range(3)]
+        l = math.sqrt(sum(c * c for c in z))
+        if l > 1e-3: break
+    z = [c / l for c in z]
+    a = [1, 0, 0] if abs(z[0]) < 0.9 else [0, 1, 0]
+    x = [a[1]*z[2] - a[2]*z[1], a[2]*z[0] - a[0]*z[2], a[0]*z[1] - a[1]*z[0]]
+    l = math.sqrt(sum(c * c for c in x))
+    x = [c / l for c in x]
+    y = [z[1]*x[2] - z[2]*x[1], z[2]*x[0] - z[0]*x[2], z[0]*x[1] - z[1]*x[0]]
+    return {'o': _round(o), 'x': _round(x), 'y': _round(y), 'z': _round(z)}
+
+def generate_scene(spheres=10, quads=0, circles=0, lights=1, reflectivity=0.0,
+                   width=128, height=128, pixel_samples=1, max_bounces=1, seed=0):
+    '''
+    returns scene JSON data (dict) with given numbers of spheres, quads, circles, and point lights
+    every surface has reflective coefficient reflectivity (kr); width, height, pixel_samples, and
+    max_bounces are set on the scene
+    '''
+    rng = random.Random(seed)
+    n = spheres + quads + circles
+    # cube of side `size` centered at origin, with surfaces ~1/4 of the spacing of a grid of n surfaces
+    size = 4 * max(1, n) ** (1 / 3)
+    radius = 0.25 * size / max(1, n) ** (1 / 3)
+
+    surfaces = []
+    for kind, count in zip(KINDS, (spheres, quads, circles)):
+        for _ in range(count):
+            o = [rng.uniform(-size / 2, size / 2) for _ in range(3)]
+            surface = {
+                'frame': _random_frame(rng, o) if kind != 'spheres' else {'o': _round(o)},
+                'radius': round(radius * rng.uniform(0.5, 1.5), 6),
+                'material': {
+                    'kd': _round([rng.uniform(0.2, 1) for _ in range(3)]),
+                    'ks': _round([rng.uniform(0, 0.5)] * 3),
+                    'n': rng.choice([10, 20, 50, 100]),
+                    'kr': [reflectivity] * 3,
+                },
+            }
+            if kind == 'quads': surface['is_quad'] = True
+            if kind == 'circles': surface['is_circle'] = True
+            surfaces.append(surface)
+
+    # lights on a ring above the cube; total intensity grows with distance squared
+    distance = size * 1.5
+    intensity = 2 * distance ** 2 / max(1, lights)
+    light_list = []
+    for i in range(lights):
+        angle = 2 * math.pi * i / max(1, lights)
+        o = [distance * math.cos(angle), distance, distance * math.sin(angle)]
+        light_list.append({'frame': {'o': _round(o)}, 'intensity': [round(intensity, 6)] * 3})
+
+    return {
+        'camera': {'eye': [0, 0, round(size * 1.5, 6)], 'width': 1.0, 'height': height / width},
+        'resolution_width': width,
+        'resolution_height': height,
+        'pixel_samples': pixel_samples,
+        'max_bounces': max_bounces,
+        'surfaces': surfaces,
+        'lights': light_list,
+    }
+
+def write_scene(filename:str, data):
+    with open(filename, 'wt') as f:
+        json.dump(data, f, indent=1)
+
+
+def sweep(counts, mix, options:RenderOptions, scene_args):
+    '''
+    generates and renders a scene for each number of surfaces in counts (dealt round-robin to kinds
+    in mix), printing and returning list of (N, setup seconds, render seconds, seconds per camera ray)
+    '''
+    rows = []
+    print('%8s %10s %10s %12s %8s' % ('N', 'setup (s)', 'render (s)', 'us/ray', 'growth'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in counts:
+            per_kind = {kind: n // len(mix) + (i < n % len(mix)) for i, kind in enumerate(mix)}
+            data = generate_scene(**per_kind, **scene_args)
+            filename = os.path.join(tmpdir, 'synthetic_%d.json' % n)
+            write_scene(filename, data)
+            result = render_once(filename, options)
+            per_ray = result['wall'] / result['rays']
+            growth = ''
+            if rows:
+                n0, _, _, per_ray0 = rows[-1]
+                growth = '%8.2f' % (math.log(per_ray / per_ray0) / math.log(n / n0))
+            rows.append((n, result['setup'], result['wall'], per_ray))
+            print('%8d %10.3f %10.3f %12.3f %8s' % (n, result['setup'], result['wall'], per_ray * 1e6, growth))
+    return rows
+
+
+def parse_args(argv=None):
+    defaults = RenderOptions()
+    parser = argparse.ArgumentParser(description='Writes synthetic scene JSON files, or renders a sweep of them to measure scaling')
+    parser.add_argument('output', metavar='scene.json', nargs='?', help='scene file to write (not with --sweep)')
+    parser.add_argument('--spheres', metavar='N', type=int, default=10, help='number of spheres (default: %(default)s)')
+    parser.add_argument('--quads', metavar='N', type=int, default=0, help='number of quads (default: %(default)s)')
+    parser.add_argument('--circles', metavar='N', type=int, default=0, help='number of circles (default: %(default)s)')
+    parser.add_argument('--lights', metavar='M', type=int, default=1, help='number of point lights (default: %(default)s)')
+    parser.add_argument('--reflectivity', metavar='R', type=float, default=0.0, help='reflective coefficient of every surface (default: %(default)s)')
+    parser.add_argument('--max-bounces', metavar='N', type=int, default=1, help='max reflection bounces (default: %(default)s)')
+    parser.add_argument('--resolution', metavar=('W', 'H'), type=int, nargs=2, default=(128, 128), help='image resolution (default: 128 128)')
+    parser.add_argument('--pixel-samples', metavar='N', type=int, default=1, help='samples per pixel in x and y (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+    parser.add_argument('--sweep', metavar='N,N,...', help='render scenes with these numbers of surfaces (ex: 10,100,1000,10000,100000)')
+    parser.add_argument('--mix', metavar='KIND,...', default=','.join(KINDS), help='surface kinds of sweep scenes (default: %(default)s)')
+    parser.add_argument('--engine', choices=ENGINES, default=defaults.engine, help='render engine of sweep (default: %(default)s)')
+    parser.add_argument('--workers', metavar='N', type=int, default=defaults.workers, help='worker processes of sweep (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if (args.output is None) == (args.sweep is None):
+        parser.error('give either an output scene file or --sweep')
+    mix = args.mix.split(',')
+    if not mix or any(kind not in KINDS for kind in mix):
+        parser.error('--mix kinds must be from: %s' % ','.join(KINDS))
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    scene_args = {
+        'lights': args.lights,
+        'reflectivity': args.reflectivity,
+        'width': args.resolution[0],
+        'height': args.resolution[1],
+        'pixel_samples': args.pixel_samples,
+        'max_bounces': args.max_bounces,
+        'seed': args.seed,
+    }
+    if args.sweep:
+        options = RenderOptions()
+        options.engine = args.engine
+        options.workers = args.workers
+        sweep([int(n) for n in args.sweep.split(',')], args.mix.split(','), options, scene_args)
+    else:
+        data = generate_scene(spheres=args.spheres, quads=args.quads, circles=args.circles, **scene_args)
+        write_scene(args.output, data)
+        print('Wrote %s: %d surfaces, %d lights' % (args.output, len(data['surfaces']), len(data['lights'])))
+
+if __name__ == '__main__':
+    main()
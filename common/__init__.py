@@ -1 +1 @@
-__all__ = ['image','maths','png','scene','utils']
+__all__ = ['bvh','compare','image','kernels','maths','options','png','scene','scene_arrays','scheduler','stats','trace','utils','wavefront']
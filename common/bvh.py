@@ -0,0 +1,300 @@
+from .maths import float_inf
+
+'''
+The following class provides a bounding volume hierarchy (BVH) over the
+surfaces of a scene.
+
+The hierarchy is built top-down using the surface area heuristic (SAH)
+over a fixed number of centroid bins per axis.  Each node stores an
+axis-aligned bounding box; leaves store a run of surface indices.
+
+`BVH.closest` walks the tree front-to-back, calling a user supplied
+function to intersect each candidate surface, and prunes any node whose
+box is entered beyond the closest hit found so far.  `BVH.any_hit` is
+the occlusion (shadow ray) variant: it returns as soon as any surface
+is hit within the ray's extent.
+
+Note: to stay pixel-identical with a linear scan over the surfaces,
+ties in `t` are resolved in favor of the surface with the larger index
+(a linear scan that accepts `t <= closest_t` keeps the last surface).
+
+The BVH is built over the RenderSurfaces of a RenderScene (see
+`compile_scene`), which are read-only, so it cannot go out of date.
+'''
+
+
+# relative and absolute padding applied to every bounding box so that
+# intersection points computed with floating-point error (ex: a point
+# on a quad that is slightly off of its plane) are still inside the box
+bounds_eps_rel = 1e-6
+bounds_eps_abs = 1e-5
+
+# inverse used for a ray direction component that is exactly zero
+inv_dir_inf = 1e300
+
+
+def surface_bounds(surface):
+    '''
+    returns axis-aligned bounds (lo,hi) of surface (RenderSurface) as two 3-tuples
+
+    spheres are bounded by center +/- radius.  quads and circles are
+    bounded by the box containing the square spanned by the frame's
+    x and y axes scaled by radius (circles are inscribed in that square).
+    '''
+    from .scene import SURFACE_SPHERE   # (not at top: scene imports this module)
+    r = surface.radius
+    if surface.kind != SURFACE_SPHERE:
+        s = surface
+        ext = (r * (abs(s.xx) + abs(s.yx)), r * (abs(s.xy) + abs(s.yy)), r * (abs(s.xz) + abs(s.yz)))
+    else:
+        ext = (r, r, r)
+    lo,hi = [],[]
+    for c,e in zip((surface.ox,surface.oy,surface.oz), ext):
+        pad = bounds_eps_abs + bounds_eps_rel * (abs(c) + e)
+        lo.append(c - e - pad)
+        hi.append(c + e + pad)
+    return tuple(lo),tuple(hi)
+
+
+def _union(lo0, hi0, lo1, hi1):
+    return (
+        (min(lo0[0],lo1[0]), min(lo0[1],lo1[1]), min(lo0[2],lo1[2])),
+        (max(hi0[0],hi1[0]), max(hi0[1],hi1[1]), max(hi0[2],hi1[2])),
+    )
+
+def _enter(lo, hi, ex, ey, ez, ix, iy, iz, tmin, tmax):
+    ''' returns t where ray enters box (lo,hi), or None if ray misses box within [tmin,tmax] '''
+    t0,t1 = (lo[0] - ex) * ix, (hi[0] - ex) * ix
+    if t0 > t1: t0,t1 = t1,t0
+    tn,tf = max(t0, tmin),min(t1, tmax)
+    t0,t1 = (lo[1] - ey) * iy, (hi[1] - ey) * iy
+    if t0 > t1: t0,t1 = t1,t0
+    if t0 > tn: tn = t0
+    if t1 < tf: tf = t1
+    t0,t1 = (lo[2] - ez) * iz, (hi[2] - ez) * iz
+    if t0 > t1: t0,t1 = t1,t0
+    if t0 > tn: tn = t0
+    if t1 < tf: tf = t1
+    return tn if tn <= tf else None
+
+def _area(lo, hi):
+    dx,dy,dz = hi[0]-lo[0], hi[1]-lo[1], hi[2]-lo[2]
+    return 2.0 * (dx*dy + dy*dz + dz*dx)
+
+
+class BVH:
+    '''
+    Bounding volume hierarchy over a list of surfaces.
+
+    Nodes are stored in flat parallel lists (node 0 is the root):
+        node_lo, node_hi: bounding box of node
+        node_left, node_right: child node indices (interior nodes)
+        node_first, node_count: run of `prims` (leaf nodes; count > 0)
+    '''
+
+    num_bins      = 12      # SAH centroid bins per axis
+    max_leaf_size = 4       # nodes with more surfaces are always split (if possible)
+    cost_traverse = 1.0     # SAH cost of a node visit relative to a surface test
+
+    def __init__(self, surfaces):
+        self.prims = []
+        self.node_lo, self.node_hi = [],[]
+        self.node_left, self.node_right = [],[]
+        self.node_first, self.node_count = [],[]
+
+        self.bounds = [surface_bounds(s) for s in surfaces]
+        self.centroids = [
+            ((lo[0]+hi[0])*0.5, (lo[1]+hi[1])*0.5, (lo[2]+hi[2])*0.5)
+            for (lo,hi) in self.bounds
+        ]
+        if self.bounds:
+            self._build(list(range(len(self.bounds))))
+
+    def __len__(self): return len(self.node_lo)
+
+    def _new_node(self, lo, hi):
+        self.node_lo.append(lo)
+        self.node_hi.append(hi)
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_first.append(0)
+        self.node_count.append(0)
+        return len(self.node_lo) - 1
+
+    def _make_leaf(self, node, indices):
+        self.node_first[node] = len(self.prims)
+        self.node_count[node] = len(indices)
+        self.prims.extend(indices)
+
+    def _build(self, indices):
+        ''' builds tree top-down (iteratively, to handle deep trees) '''
+        root = self._new_node(*self._bounds_of(indices))
+        todo = [(root, indices)]
+        while todo:
+            node,indices = todo.pop()
+            split = self._find_split(node, indices)
+            if split is None:
+                self._make_leaf(node, indices)
+                continue
+            left,right = split
+            nl = self._new_node(*self._bounds_of(left))
+            nr = self._new_node(*self._bounds_of(right))
+            self.node_left[node] = nl
+            self.node_right[node] = nr
+            todo.append((nr, right))
+            todo.append((nl, left))
+
+    def _bounds_of(self, indices):
+        bounds = self.bounds
+        lo,hi = bounds[indices[0]]
+        for i in indices[1:]:
+            lo,hi = _union(lo, hi, *bounds[i])
+        return lo,hi
+
+    def _find_split(self, node, indices):
+        ''' returns (left,right) index lists of best SAH split, or None if node should be a leaf '''
+        n = len(indices)
+        if n <= 1: return None
+
+        centroids,bounds = self.centroids,self.bounds
+        area = _area(self.node_lo[node], self.node_hi[node])
+        nbins = self.num_bins
+
+        best_cost,best_axis,best_bin = float_inf,None,None
+        best_lo,best_scale = 0.0,0.0
+        for axis in range(3):
+            cmin = min(centroids[i][axis] for i in indices)
+            cmax = max(centroids[i][axis] for i in indices)
+            if cmax <= cmin: continue
+            scale = nbins / (cmax - cmin)
+
+            counts = [0] * nbins
+            boxes = [None] * nbins
+            for i in indices:
+                b = min(nbins - 1, int((centroids[i][axis] - cmin) * scale))
+                counts[b] += 1
+                boxes[b] = bounds[i] if boxes[b] is None else _union(*boxes[b], *bounds[i])
+
+            # sweep from right to collect suffix areas and counts
+            right_area = [0.0] * nbins
+            right_count = [0] * nbins
+            acc,cnt = None,0
+            for b in range(nbins - 1, 0, -1):
+                if boxes[b] is not None:
+                    acc = boxes[b] if acc is None else _union(*acc, *boxes[b])
+                    cnt += counts[b]
+                right_area[b] = _area(*acc) if acc else 0.0
+                right_count[b] = cnt
+
+            acc,cnt = None,0
+            for b in range(nbins - 1):
+                if boxes[b] is not None:
+                    acc = boxes[b] if acc is None else _union(*acc, *boxes[b])
+                    cnt += counts[b]
+                if cnt == 0 or cnt == n: continue
+                cost = _area(*acc) * cnt + right_area[b+1] * right_count[b+1]
+                if cost < best_cost:
+                    best_cost,best_axis,best_bin = cost,axis,b
+                    best_lo,best_scale = cmin,scale
+
+        if best_axis is None: return None
+
+        best_cost = self.cost_traverse + best_cost / area if area > 0 else float_inf
+        if best_cost >= n and n <= self.max_leaf_size: return None
+
+        left,right = [],[]
+        for i in indices:
+            b = min(nbins - 1, int((centroids[i][best_axis] - best_lo) * best_scale))
+            (left if b <= best_bin else right).append(i)
+        return left,right
+
+    def closest(self, ray, surfaces, fn_intersect):
+        '''
+        returns (t, surface) of closest valid intersection of ray with surfaces; otherwise returns None
+
+        fn_intersect(surface, ray) must return the ray t of intersection or None if not hit.
+        '''
+        if not self.node_lo: return None
+
+        ex,ey,ez = ray.e.x,ray.e.y,ray.e.z
+        dx,dy,dz = ray.d.x,ray.d.y,ray.d.z
+        ix = 1.0 / dx if dx else inv_dir_inf
+        iy = 1.0 / dy if dy else inv_dir_inf
+        iz = 1.0 / dz if dz else inv_dir_inf
+        ray_min = ray.min
+
+        node_lo,node_hi = self.node_lo,self.node_hi
+        node_left,node_right = self.node_left,self.node_right
+        node_first,node_count = self.node_first,self.node_count
+        prims = self.prims
+
+        best_t,best_i = ray.max,-1
+        t_root = _enter(node_lo[0], node_hi[0], ex,ey,ez, ix,iy,iz, ray_min, best_t)
+        if t_root is None: return None
+        stack = [(t_root, 0)]
+        while stack:
+            tn,node = stack.pop()
+            if tn > best_t: continue
+            count = node_count[node]
+            if count:
+                first = node_first[node]
+                for k in range(first, first+count):
+                    i = prims[k]
+                    t = fn_intersect(surfaces[i], ray)
+                    if t is None or t < ray_min or t > best_t: continue
+                    if t < best_t or i > best_i:
+                        best_t,best_i = t,i
+                continue
+            l,r = node_left[node],node_right[node]
+            tl = _enter(node_lo[l], node_hi[l], ex,ey,ez, ix,iy,iz, ray_min, best_t)
+            tr = _enter(node_lo[r], node_hi[r], ex,ey,ez, ix,iy,iz, ray_min, best_t)
+            if tl is None:
+                if tr is not None: stack.append((tr, r))
+            elif tr is None:
+                stack.append((tl, l))
+            elif tl <= tr:
+                stack.append((tr, r))
+                stack.append((tl, l))
+            else:
+                stack.append((tl, l))
+                stack.append((tr, r))
+
+        if best_i < 0: return None
+        return best_t,surfaces[best_i]
+
+    def any_hit(self, ray, surfaces, fn_intersect):
+        '''
+        returns True if ray has any valid intersection with surfaces (ray t within ray min/max); otherwise returns False
+
+        Unlike `closest`, the traversal is unordered and stops at the first valid hit.
+        fn_intersect(surface, ray) must return the ray t of intersection or None if not hit.
+        '''
+        if not self.node_lo: return False
+
+        ex,ey,ez = ray.e.x,ray.e.y,ray.e.z
+        dx,dy,dz = ray.d.x,ray.d.y,ray.d.z
+        ix = 1.0 / dx if dx else inv_dir_inf
+        iy = 1.0 / dy if dy else inv_dir_inf
+        iz = 1.0 / dz if dz else inv_dir_inf
+        ray_min,ray_max = ray.min,ray.max
+
+        node_lo,node_hi = self.node_lo,self.node_hi
+        node_left,node_right = self.node_left,self.node_right
+        node_first,node_count = self.node_first,self.node_count
+        prims = self.prims
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if _enter(node_lo[node], node_hi[node], ex,ey,ez, ix,iy,iz, ray_min, ray_max) is None: continue
+            count = node_count[node]
+            if count:
+                first = node_first[node]
+                for i in range(first, first+count):
+                    t = fn_intersect(surfaces[prims[i]], ray)
+                    if t is not None and ray_min <= t <= ray_max:
+                        return True
+                continue
+            stack.append(node_right[node])
+            stack.append(node_left[node])
+        return False
@@ -0,0 +1,198 @@
+import os
+import sys
+import glob
+import argparse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .png import Reader, Writer
+
+'''
+The following functions compare rendered images against reference
+images (ex: scenes/01_sphere.png against scenes/01_sphere_ref.png),
+pixel by pixel on 8-bit RGBA values (as saved by `Image.save`).
+
+`compare_files` returns an `ImageDiff` with exact-match, max and mean
+channel error, number of mismatched pixels, and the bounding box of the
+mismatched pixels.  `save_heatmap` writes a PNG showing where (and by
+how much) the images differ.  Files are decoded straight into NumPy
+arrays (see `png.Reader.asRGBA8Array`), and byte-identical files are
+not decoded at all, so a whole directory compares in seconds.
+
+Command line (exit status is 1 if any image does not match):
+
+    python3 -m common.compare scenes/                   # each *_ref.png against its render
+    python3 -m common.compare render.png [ref.png]      # ref defaults to render_ref.png
+    python3 -m common.compare render.png --diff diff.png
+
+NumPy is required.
+'''
+
+
+REF_SUFFIX = '_ref'
+
+
+class ImageDiff:
+    __slots__ = ['width','height','mismatched','max_error','mean_error','bbox','error']
+    def __init__(self, width, height):
+        self.width      = width     # image size (both images)
+        self.height     = height
+        self.mismatched = 0         # number of pixels with any channel different
+        self.max_error  = 0         # max abs difference of a channel (0-255)
+        self.mean_error = 0.0       # mean abs difference over all channels of all pixels
+        self.bbox       = None      # (x0,y0,x1,y1) bounding mismatched pixels (x1,y1 exclusive), or None
+        self.error      = None      # (height,width) array of max channel difference per pixel, or None
+
+    @property
+    def match(self):
+        return self.mismatched == 0
+
+    def summary(self):
+        if self.match:
+            return 'match'
+        x0,y0,x1,y1 = self.bbox
+        return 'MISMATCH %d pixels in (%d,%d)-(%d,%d), max error %d, mean error %0.4f' % (
+            self.mismatched, x0, y0, x1, y1, self.max_error, self.mean_error)
+
+
+def ref_filename(filename:str):
+    ''' returns filename of reference image of rendered image filename (ex: a.png => a_ref.png) '''
+    base,ext = os.path.splitext(filename)
+    return '%s%s%s' % (base, REF_SUFFIX, ext)
+
+def load_rgba8(filename:str):
+    ''' returns (height, width, 4) uint8 array of PNG file '''
+    width,height,pixels,_ = Reader(filename=filename).asRGBA8Array()
+    return pixels
+
+def compare_arrays(a, b, early_exit=False):
+    '''
+    returns ImageDiff of (height, width, 4) uint8 arrays a and b, which must be the same size
+    with early_exit, rows are compared in order and comparing stops at the first row with a
+    mismatch, so counts and errors only cover that row (error array is not kept)
+    '''
+    assert a.shape == b.shape, 'images must be the same size'
+    height,width,_ = a.shape
+    diff = ImageDiff(width, height)
+    if early_exit:
+        for y in range(height):
+            if not np.array_equal(a[y], b[y]):
+                a,b = a[y:y+1],b[y:y+1]
+                break
+        else:
+            return diff
+    else:
+        y = 0
+    error = np.abs(a.astype(np.int16) - b.astype(np.int16))
+    pixel_error = error.max(axis=2)
+    rows, cols = np.nonzero(pixel_error)
+    if len(rows):
+        diff.mismatched = len(rows)
+        diff.max_error = int(error.max())
+        diff.mean_error = float(error.mean())
+        diff.bbox = (int(cols.min()), y + int(rows.min()), int(cols.max()) + 1, y + int(rows.max()) + 1)
+    if not early_exit:
+        diff.error = pixel_error
+    return diff
+
+def compare_files(filename:str, ref:str=None, early_exit=False):
+    '''
+    returns ImageDiff of PNG file filename against PNG file ref (default: `ref_filename(filename)`)
+    byte-identical files match without being decoded (error array is then None)
+    raises ValueError if the images are not the same size
+    '''
+    ref = ref or ref_filename(filename)
+    if _same_bytes(filename, ref):
+        width,height = _size(filename)
+        return ImageDiff(width, height)
+    a,b = load_rgba8(filename),load_rgba8(ref)
+    if a.shape != b.shape:
+        raise ValueError('image sizes differ: %dx%d vs %dx%d' % (a.shape[1], a.shape[0], b.shape[1], b.shape[0]))
+    return compare_arrays(a, b, early_exit=early_exit)
+
+def _same_bytes(filename_a:str, filename_b:str):
+    if os.path.getsize(filename_a) != os.path.getsize(filename_b): return False
+    with open(filename_a, 'rb') as fa, open(filename_b, 'rb') as fb:
+        return fa.read() == fb.read()
+
+def _size(filename:str):
+    reader = Reader(filename=filename)
+    reader.preamble()
+    return reader.width, reader.height
+
+def save_heatmap(diff:ImageDiff, filename:str):
+    '''
+    writes heatmap of diff.error to PNG file filename: matching pixels are black, mismatched
+    pixels go from dark red (error 1) through yellow to white (diff.max_error)
+    '''
+    assert diff.error is not None, 'diff has no error array (compare without early_exit)'
+    t = diff.error / max(diff.max_error, 1)
+    t[diff.error > 0] = 0.25 + 0.75 * t[diff.error > 0]     # keep smallest errors visible
+    heat = np.clip(np.stack([3 * t, 3 * t - 1, 3 * t - 2], axis=2), 0, 1)
+    heat = (heat * 255).astype(np.uint8)
+    with open(filename, 'wb') as f:
+        Writer(diff.width, diff.height, bitdepth=8).write(f, heat.reshape(diff.height, -1))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compares rendered images against their reference (_ref.png) images')
+    parser.add_argument('paths', metavar='PATH', nargs='+', help='rendered image (optionally followed by its reference image), or directory of reference images')
+    parser.add_argument('--diff', metavar='FILE', help='write heatmap of differences to PNG file (single image, if it does not match)')
+    parser.add_argument('--diff-dir', metavar='DIR', help='write heatmap of each mismatched image to DIR (name_diff.png)')
+    parser.add_argument('--early-exit', action='store_true', help='stop at first mismatched row of an image, and at first mismatched image')
+    return parser.parse_args(argv)
+
+def _pairs(paths):
+    ''' returns list of (rendered, reference) filenames for command line paths '''
+    if len(paths) == 2 and all(os.path.isfile(p) for p in paths):
+        return [tuple(paths)]
+    pairs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for ref in sorted(glob.glob(os.path.join(path, '*%s.png' % REF_SUFFIX))):
+                pairs.append((ref[:-len(REF_SUFFIX + '.png')] + '.png', ref))
+        else:
+            pairs.append((path, ref_filename(path)))
+    return pairs
+
+def main(argv=None):
+    args = parse_args(argv)
+    pairs = _pairs(args.paths)
+    if args.diff and len(pairs) != 1:
+        sys.exit('--diff needs a single image; use --diff-dir')
+    early_exit = args.early_exit and not (args.diff or args.diff_dir)
+
+    failed = 0
+    for filename, ref in pairs:
+        name = os.path.basename(filename)
+        if not os.path.exists(filename) or not os.path.exists(ref):
+            print('%s: MISSING %s' % (name, filename if not os.path.exists(filename) else ref))
+            failed += 1
+        else:
+            try:
+                diff = compare_files(filename, ref, early_exit=early_exit)
+                print('%s: %s' % (name, diff.summary()))
+            except ValueError as e:
+                print('%s: MISMATCH %s' % (name, e))
+                diff = None
+            if diff is None or not diff.match:
+                failed += 1
+                if diff and args.diff:
+                    save_heatmap(diff, args.diff)
+                if diff and args.diff_dir:
+                    os.makedirs(args.diff_dir, exist_ok=True)
+                    save_heatmap(diff, os.path.join(args.diff_dir, '%s_diff.png' % os.path.splitext(name)[0]))
+        if failed and args.early_exit:
+            break
+
+    if failed and args.early_exit:
+        print('Stopped at first mismatch')
+    else:
+        print('%d of %d images match' % (len(pairs) - failed, len(pairs)))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
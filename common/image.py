@@ -1,8 +1,16 @@
 #import png     # see: https://pythonhosted.org/pypng/png.html
+try:
+    import numpy as np
+except ImportError:
+    np = None
+import weakref
 from math import pi, cos, sin, floor, asin
+from array import array
+from multiprocessing import shared_memory
 from .png import Reader, Writer
 from .png import from_array as png_from_array
 from .maths import clamp, sqrt
+from . import trace
 
 '''
 The following class provides basic functionality for creating, loading,
@@ -26,6 +34,23 @@ representing either red,green,blue or red,green,blue,alpha colors,
 respectively.  If alpha is not given, alpha=1.
 
 The pixel getter functions always returns a 4-tuple (RGBA).
+
+`SharedImage` is an Image whose pixels are stored in a block of shared
+memory (`multiprocessing.shared_memory`) instead of Python lists, so
+that several processes can write pixels of the same image in place.
+
+`ArrayImage` is an Image whose pixels are stored in a NumPy array of
+shape (height, width, 4).  Whole rows and tiles can be set at once
+(`set_row`, `set_tile`), `tile` returns a view (no copy) of a rectangle
+of pixels.  NumPy is optional; `ArrayImage` requires it.
+
+When NumPy is available, `save` (of any Image) clamps, quantizes,
+filters, and compresses the pixels with whole-array operations (see
+`quantize` and `png.Writer.write_ndarray`).
+
+`save_rows` saves rows as they are produced (ex: by a render), without
+an Image: only a few rows are in memory at once, and the file holds
+every row written so far (see `flush_rows`) if writing is cut short.
 '''
 
 
@@ -33,6 +58,10 @@ class Image:
     @staticmethod
     def from_file(filename):
         p = Reader(filename=filename)
+        if np is not None:
+            # decode with NumPy straight into an array
+            width,height,pixels,metadata = p.asRGBA8Array()
+            return ArrayImage(width, height, pixels=pixels/255.0, dtype=np.float64)
         width,height,pixels,metadata = p.asRGBA8()
         pixels = [[v/255.0 for v in row] for row in pixels]
         return Image(width, height, pixels=pixels)
@@ -64,11 +93,221 @@ class Image:
         x,y = pos
         return self.pixels[y][x*4:x*4+4]
 
-    def save(self, filename):
-        info = {'width':self.width, 'height':self.height, 'bitdepth':8}
-        pixels = [[int(255*clamp(v,0,1)) for v in row] for row in self.pixels]
-        p = png_from_array(pixels, mode="RGBA", info=info)
-        p.save(filename)
+    def set_row(self, pos, values):
+        ''' sets consecutive pixels of a row starting at pos=(x,y) to flat RGBA values '''
+        x,y = pos
+        self.pixels[y][x*4:x*4+len(values)] = values
+
+    def iter_rows(self):
+        ''' iterates over rows of image in "flat pixel" format '''
+        return iter(self.pixels)
+
+    def close(self):
+        ''' releases resources held by image (see SharedImage) '''
+        pass
+
+    def as_array(self):
+        ''' returns pixels as (height, width, 4) NumPy array (requires NumPy) '''
+        return np.array(self.pixels, dtype=np.float64).reshape(self.height, self.width, 4)
+
+    def save(self, filename, filter_type=0, compression=None, compression_threads=None):
+        '''
+        saves image as 8-bit RGBA PNG, clamping values to [0,1]
+        filter_type is the PNG scanline filter: 0 to 4, or 'adaptive' (see png.Writer)
+        compression is the zlib level (0 to 9; None: default), compressed with compression_threads threads if > 1
+        '''
+        info = {'width':self.width, 'height':self.height, 'bitdepth':8, 'filter_type':filter_type,
+                'compression':compression, 'compression_threads':compression_threads}
+        with trace.span('png encode', file=filename):
+            if np is not None:
+                pixels = quantize(self.as_array())
+            else:
+                pixels = ([int(255*clamp(v,0,1)) for v in row] for row in self.iter_rows())
+            p = png_from_array(pixels, mode="RGBA", info=info)
+            p.save(filename)
+
+
+def save_rows(filename, width, height, rows, filter_type=0, flush_rows=16, compression=None, compression_threads=None):
+    '''
+    saves rows (iterable of rows top to bottom, each width*4 RGBA floats) as 8-bit RGBA PNG, clamping values to [0,1]
+    rows are quantized, filtered, and compressed one at a time; every flush_rows rows the compressed
+    data is written out and the file flushed (see png.Writer), so a partial file can be opened
+    filter_type, compression, and compression_threads are as for `Image.save`
+    '''
+    writer = Writer(width, height, alpha=True, bitdepth=8, filter_type=filter_type, flush_rows=flush_rows,
+                    compression=compression, compression_threads=compression_threads)
+    if np is not None:
+        pixels = (quantize(np.asarray(row, dtype=np.float64).reshape(1, width, 4))[0] for row in rows)
+    else:
+        pixels = ([int(255*clamp(v,0,1)) for v in row] for row in rows)
+    # rows are computed as they are encoded, so spans of computing them are nested in this one
+    with open(filename, 'wb') as f, trace.span('png encode', file=filename, streamed=True):
+        writer.write(f, pixels)
+
+
+def quantize(values):
+    '''
+    returns (height, width*4) uint8 array of (height, width, 4) float array clamped to [0,1] and scaled to [0,255]
+    matches `int(255*clamp(v,0,1))` for every value (NaN becomes 255); requires NumPy
+    '''
+    height,width,_ = values.shape
+    # one copy of the values, clipped in their own dtype (NaN stays NaN); the rest is in place
+    v = np.clip(values, 0, 1)
+    np.nan_to_num(v, copy=False, nan=1.0)
+    # scale in float64, as `int(255*v)` does (in place unless values are float32)
+    v = np.multiply(v, 255, out=v if v.dtype == np.float64 else None, dtype=np.float64)
+    return v.astype(np.uint8).reshape(height, width * 4)
+
+
+class SharedImage(Image):
+    '''
+    Image stored as a flat (height x width x 4) array of floats in shared
+    memory.  The creating process owns the block; other processes attach
+    to it by name (see `name`) and write pixels in place.
+
+    typecode selects the float type: 'f' (float32) halves the memory of
+    'd' (float64), but rounding to float32 can change the 8-bit value of
+    a pixel when saving (ex: averaged anti-aliasing samples that land on
+    a quantization boundary), so 'd' is needed to match float64 renders
+    exactly.
+
+    Call `close` when done with the image; the owner also frees the block.
+    If the image is garbage collected without `close`, it is closed then.
+    '''
+
+    def __init__(self, width, height, name=None, typecode='d', default_color=(0,0,0,1)):
+        self.width,self.height = width,height
+        self.typecode = typecode
+        self.owner = name is None
+        nbytes = width * height * 4 * array(typecode).itemsize
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.values = self.shm.buf[:nbytes].cast(typecode)
+        self._finalizer = weakref.finalize(self, _close_shared_memory, self.shm, self.values, self.owner)
+        if self.owner:
+            row = array(typecode, list(default_color) * width)
+            for y in range(height): self.set_row((0,y), row)
+
+    @property
+    def name(self): return self.shm.name
+
+    def close(self):
+        ''' releases the shared memory (the owner also frees the block); does nothing if already closed '''
+        self._finalizer()
+
+    def _index(self, x, y): return (y * self.width + x) * 4
+
+    def __setitem__(self, pos, color):
+        if len(color) == 3: color = [color[0], color[1], color[2], 1]
+        i = self._index(*pos)
+        self.values[i:i+4] = array(self.typecode, color)
+    def __getitem__(self, pos):
+        i = self._index(*pos)
+        return self.values[i:i+4].tolist()
+
+    def set(self, pos, color): self[pos] = color
+    def get(self, pos): return self[pos]
+
+    def set_row(self, pos, values):
+        i = self._index(*pos)
+        if type(values) is not array or values.typecode != self.typecode:
+            values = array(self.typecode, values)
+        self.values[i:i+len(values)] = values
+
+    def iter_rows(self):
+        stride = self.width * 4
+        for y in range(self.height):
+            yield self.values[y*stride:(y+1)*stride].tolist()
+
+    @property
+    def pixels(self):
+        ''' copy of pixels in "boxed row flat pixel" format '''
+        return list(self.iter_rows())
+
+    def as_array(self):
+        return np.frombuffer(self.values, dtype=self.typecode).reshape(self.height, self.width, 4)
+
+
+def _close_shared_memory(shm, values, owner):
+    # free the name first, so the block cannot leak even if it cannot be closed
+    # (arrays from `as_array` still in use keep it mapped until they are freed)
+    if owner: shm.unlink()
+    try:
+        values.release()
+        shm.close()
+    except BufferError:
+        pass
+
+
+class ArrayImage(Image):
+    '''
+    Image stored as a (height, width, 4) NumPy array (see `array`).
+
+    dtype selects the float type: float32 (default) halves the memory of
+    float64, but (as with `SharedImage`) rounding to float32 can change
+    the 8-bit value of a pixel when saving, so use float64 to match
+    float64 renders exactly.
+    '''
+
+    def __init__(self, width, height, pixels=None, default_color=(0,0,0,1), dtype=None):
+        assert np is not None, 'ArrayImage requires NumPy to be installed'
+        self.width,self.height = width,height
+        self.array = np.empty((height, width, 4), dtype=dtype or np.float32)
+        if pixels is None:
+            self.array[:,:] = default_color
+        else:
+            self.array[...] = np.asarray(pixels, dtype=self.array.dtype).reshape(height, width, 4)
+
+    @property
+    def dtype(self): return self.array.dtype
+
+    def __setitem__(self, pos, color):
+        x,y = pos
+        if len(color) == 3: color = [color[0], color[1], color[2], 1]
+        self.array[y,x] = color
+    def __getitem__(self, pos):
+        x,y = pos
+        return self.array[y,x].tolist()
+
+    def set(self, pos, color): self[pos] = color
+    def get(self, pos): return self[pos]
+
+    def set_row(self, pos, values):
+        ''' sets consecutive pixels of a row starting at pos=(x,y) to flat RGBA values '''
+        x,y = pos
+        row = self.array[y].reshape(-1)
+        row[x*4:x*4+len(values)] = values
+
+    def set_tile(self, pos, values):
+        '''
+        sets rectangle of pixels with top-left corner at pos=(x,y) to values
+        values is a (h,w,4) or (h,w,3) array (alpha=1), or a list of h rows of flat RGBA values
+        '''
+        x,y = pos
+        values = np.asarray(values)
+        if values.ndim == 2: values = values.reshape(values.shape[0], -1, 4)
+        h,w,c = values.shape
+        tile = self.array[y:y+h, x:x+w]
+        tile[:,:,:c] = values
+        if c == 3: tile[:,:,3] = 1
+
+    def tile(self, x0, y0, x1, y1):
+        ''' returns (y1-y0, x1-x0, 4) view (not a copy) of pixels in [x0,x1) x [y0,y1) '''
+        return self.array[y0:y1, x0:x1]
+
+    def iter_rows(self):
+        ''' iterates over rows of image as flat (width*4) arrays '''
+        return iter(self.array.reshape(self.height, self.width * 4))
+
+    @property
+    def pixels(self):
+        ''' copy of pixels in "boxed row flat pixel" format '''
+        return self.array.reshape(self.height, self.width * 4).tolist()
+
+    def as_array(self):
+        return self.array
 
 
 def generate_image0():
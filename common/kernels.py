@@ -0,0 +1,473 @@
+import time
+from math import sqrt
+
+from .scene import compile_scene, SURFACE_SPHERE, SURFACE_QUAD
+from .bvh import inv_dir_inf
+from .maths import float_inf, _normalized3
+
+'''
+The following functions provide a scalar raytracer that works on plain
+floats, as an alternative to the object-based per-ray engine in
+P02_Raytrace.py (which does all arithmetic through Vector, Point, and
+Direction objects).
+
+Rays, surface frames, normals, and colors are float locals or tuples,
+so the inner loops (BVH traversal, surface tests, shading) allocate no
+Vector objects and do no type checks.  `prepare` flattens a RenderScene
+into a KernelScene of tuples once; `raytrace_tile` renders a tile of it.
+
+Render statistics are counted into `KernelScene.stats` when it is set
+(a RenderStats, see common/stats.py); when it is None, the only cost is
+one check per traversal and per BVH leaf.
+
+Note: every float operation is done in the same order as the object
+engine, including the quirks of `Vector.normalize` (see `maths._normalized3`)
+and of `Direction.__neg__` (which re-normalizes), so images are
+bit-identical to the object engine.  If you change the math of one
+engine, change the other to match.
+'''
+
+
+# minimum ray t (matches default `min_dist` of `Ray`)
+ray_min = 0.00005
+
+
+class KernelScene:
+    '''
+    RenderScene flattened to tuples of floats:
+        surfaces:   (kind, ox,oy,oz, nx,ny,nz, xx,xy,xz, yx,yy,yz, d, radius, radius2) per surface
+        materials:  (kd, ks, n, kr) per surface, where kd, ks, kr are (r,g,b) tuples
+        lights:     (ox,oy,oz, zx,zy,zz, intensity, is_point) per light
+        node_*, prims: the scene's BVH (see common/bvh.py)
+        stats:      RenderStats that rays and tests are counted into, or None (not counted)
+    '''
+    __slots__ = [
+        'scene', 'surfaces', 'materials', 'lights', 'background', 'ambient',
+        'max_bounces', 'reflection_cutoff',
+        'node_lo', 'node_hi', 'node_left', 'node_right', 'node_first', 'node_count', 'prims',
+        'stats',
+        ]
+
+def prepare(scene):
+    ''' returns KernelScene of scene (Scene, RenderScene, or KernelScene) '''
+    if type(scene) is KernelScene: return scene
+    scene = compile_scene(scene)
+    ks = KernelScene()
+    ks.scene = scene
+    ks.surfaces = [
+        (s.kind, s.ox,s.oy,s.oz, s.nx,s.ny,s.nz, s.xx,s.xy,s.xz, s.yx,s.yy,s.yz, s.d, s.radius, s.radius2)
+        for s in scene.surfaces
+    ]
+    ks.materials = [
+        (s.material.kd.xyz, s.material.ks.xyz, s.material.n, s.material.kr.xyz)
+        for s in scene.surfaces
+    ]
+    ks.lights = [
+        (l.o.x,l.o.y,l.o.z, l.z.x,l.z.y,l.z.z, l.intensity.xyz, l.is_point)
+        for l in scene.lights
+    ]
+    ks.background = scene.background.xyz
+    ks.ambient = scene.ambient.xyz
+    ks.max_bounces = scene.max_bounces
+    ks.reflection_cutoff = scene.reflection_cutoff
+    bvh = scene.bvh
+    ks.node_lo, ks.node_hi = bvh.node_lo, bvh.node_hi
+    ks.node_left, ks.node_right = bvh.node_left, bvh.node_right
+    ks.node_first, ks.node_count = bvh.node_first, bvh.node_count
+    ks.prims = bvh.prims
+    ks.stats = None
+    return ks
+
+
+'''
+`closest` and `any_hit` are `BVH.closest` and `BVH.any_hit` with the
+box test (`bvh._enter`) and surface tests (`intersect_sphere`, ...)
+inlined, so a ray costs no function calls per node or surface.
+`closest_stats` and `any_hit_stats` call them, counting into ks.stats.
+'''
+
+def _count_tests(stats, surfaces, prims, first, count, n=1):
+    ''' adds n to stats.tests of each surface prims[first:first+count] '''
+    tests = stats.tests
+    for k in range(first, first+count):
+        tests[surfaces[prims[k]][0]] += n
+
+def closest(ks, ex, ey, ez, dx, dy, dz, tmax):
+    ''' returns (t, surface index) of closest intersection of ray with scene within [ray_min,tmax]; otherwise returns None '''
+    node_lo = ks.node_lo
+    if not node_lo: return None
+    node_hi,node_left,node_right = ks.node_hi,ks.node_left,ks.node_right
+    node_first,node_count,prims,surfaces = ks.node_first,ks.node_count,ks.prims,ks.surfaces
+    ix = 1.0 / dx if dx else inv_dir_inf
+    iy = 1.0 / dy if dy else inv_dir_inf
+    iz = 1.0 / dz if dz else inv_dir_inf
+    stats = ks.stats
+
+    best_t,best_i = tmax,-1
+    lo,hi = node_lo[0],node_hi[0]
+    t0,t1 = (lo[0] - ex) * ix, (hi[0] - ex) * ix
+    if t0 > t1: t0,t1 = t1,t0
+    tn,tf = max(t0, ray_min),min(t1, best_t)
+    t0,t1 = (lo[1] - ey) * iy, (hi[1] - ey) * iy
+    if t0 > t1: t0,t1 = t1,t0
+    if t0 > tn: tn = t0
+    if t1 < tf: tf = t1
+    t0,t1 = (lo[2] - ez) * iz, (hi[2] - ez) * iz
+    if t0 > t1: t0,t1 = t1,t0
+    if t0 > tn: tn = t0
+    if t1 < tf: tf = t1
+    if not tn <= tf: return None
+    stack = [(tn, 0)]
+    while stack:
+        tn,node = stack.pop()
+        if tn > best_t: continue
+        count = node_count[node]
+        if count:
+            first = node_first[node]
+            if stats is not None: _count_tests(stats, surfaces, prims, first, count)
+            for k in range(first, first+count):
+                i = prims[k]
+                kind,ox,oy,oz,nx,ny,nz,xx,xy,xz,yx,yy,yz,sd,r,r2 = surfaces[i]
+                if kind == SURFACE_SPHERE:
+                    vx,vy,vz = ex - ox, ey - oy, ez - oz
+                    b = 2 * (dx * vx + dy * vy + dz * vz)
+                    c = (vx * vx + vy * vy + vz * vz) - r2
+                    disc = b * b - 4 * c
+                    if disc < 0: continue
+                    t = (-b - sqrt(disc)) / 2
+                else:
+                    dn = dx * nx + dy * ny + dz * nz
+                    if dn == 0: continue
+                    t = (sd - (nx * ex + ny * ey + nz * ez)) / dn
+                    vx = ex + dx * t - ox
+                    vy = ey + dy * t - oy
+                    vz = ez + dz * t - oz
+                    lx = xx * vx + xy * vy + xz * vz
+                    ly = yx * vx + yy * vy + yz * vz
+                    if kind == SURFACE_QUAD:
+                        if abs(lx) > r or abs(ly) > r: continue
+                    elif lx * lx + ly * ly > r2: continue
+                if t < ray_min or t > best_t: continue
+                if t < best_t or i > best_i:
+                    best_t,best_i = t,i
+            continue
+        l,rn = node_left[node],node_right[node]
+
+        lo,hi = node_lo[l],node_hi[l]
+        t0,t1 = (lo[0] - ex) * ix, (hi[0] - ex) * ix
+        if t0 > t1: t0,t1 = t1,t0
+        tl,tf = max(t0, ray_min),min(t1, best_t)
+        t0,t1 = (lo[1] - ey) * iy, (hi[1] - ey) * iy
+        if t0 > t1: t0,t1 = t1,t0
+        if t0 > tl: tl = t0
+        if t1 < tf: tf = t1
+        t0,t1 = (lo[2] - ez) * iz, (hi[2] - ez) * iz
+        if t0 > t1: t0,t1 = t1,t0
+        if t0 > tl: tl = t0
+        if t1 < tf: tf = t1
+        if not tl <= tf: tl = None
+
+        lo,hi = node_lo[rn],node_hi[rn]
+        t0,t1 = (lo[0] - ex) * ix, (hi[0] - ex) * ix
+        if t0 > t1: t0,t1 = t1,t0
+        tr,tf = max(t0, ray_min),min(t1, best_t)
+        t0,t1 = (lo[1] - ey) * iy, (hi[1] - ey) * iy
+        if t0 > t1: t0,t1 = t1,t0
+        if t0 > tr: tr = t0
+        if t1 < tf: tf = t1
+        t0,t1 = (lo[2] - ez) * iz, (hi[2] - ez) * iz
+        if t0 > t1: t0,t1 = t1,t0
+        if t0 > tr: tr = t0
+        if t1 < tf: tf = t1
+        if not tr <= tf: tr = None
+
+        if tl is None:
+            if tr is not None: stack.append((tr, rn))
+        elif tr is None:
+            stack.append((tl, l))
+        elif tl <= tr:
+            stack.append((tr, rn))
+            stack.append((tl, l))
+        else:
+            stack.append((tl, l))
+            stack.append((tr, rn))
+
+    if best_i < 0: return None
+    return best_t,best_i
+
+def any_hit(ks, ex, ey, ez, dx, dy, dz, tmax):
+    ''' returns True if ray hits any surface in scene with t within [ray_min,tmax]; otherwise returns False '''
+    node_lo = ks.node_lo
+    if not node_lo: return False
+    node_hi,node_left,node_right = ks.node_hi,ks.node_left,ks.node_right
+    node_first,node_count,prims,surfaces = ks.node_first,ks.node_count,ks.prims,ks.surfaces
+    ix = 1.0 / dx if dx else inv_dir_inf
+    iy = 1.0 / dy if dy else inv_dir_inf
+    iz = 1.0 / dz if dz else inv_dir_inf
+    stats = ks.stats
+
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        lo,hi = node_lo[node],node_hi[node]
+        t0,t1 = (lo[0] - ex) * ix, (hi[0] - ex) * ix
+        if t0 > t1: t0,t1 = t1,t0
+        tn,tf = max(t0, ray_min),min(t1, tmax)
+        t0,t1 = (lo[1] - ey) * iy, (hi[1] - ey) * iy
+        if t0 > t1: t0,t1 = t1,t0
+        if t0 > tn: tn = t0
+        if t1 < tf: tf = t1
+        t0,t1 = (lo[2] - ez) * iz, (hi[2] - ez) * iz
+        if t0 > t1: t0,t1 = t1,t0
+        if t0 > tn: tn = t0
+        if t1 < tf: tf = t1
+        if not tn <= tf: continue
+        count = node_count[node]
+        if count:
+            first = node_first[node]
+            if stats is not None: _count_tests(stats, surfaces, prims, first, count)
+            for k in range(first, first+count):
+                kind,ox,oy,oz,nx,ny,nz,xx,xy,xz,yx,yy,yz,sd,r,r2 = surfaces[prims[k]]
+                if kind == SURFACE_SPHERE:
+                    vx,vy,vz = ex - ox, ey - oy, ez - oz
+                    b = 2 * (dx * vx + dy * vy + dz * vz)
+                    c = (vx * vx + vy * vy + vz * vz) - r2
+                    disc = b * b - 4 * c
+                    if disc < 0: continue
+                    t = (-b - sqrt(disc)) / 2
+                else:
+                    dn = dx * nx + dy * ny + dz * nz
+                    if dn == 0: continue
+                    t = (sd - (nx * ex + ny * ey + nz * ez)) / dn
+                    vx = ex + dx * t - ox
+                    vy = ey + dy * t - oy
+                    vz = ez + dz * t - oz
+                    lx = xx * vx + xy * vy + xz * vz
+                    ly = yx * vx + yy * vy + yz * vz
+                    if kind == SURFACE_QUAD:
+                        if abs(lx) > r or abs(ly) > r: continue
+                    elif lx * lx + ly * ly > r2: continue
+                if ray_min <= t <= tmax:
+                    # surfaces after k in leaf were counted but not tested
+                    if stats is not None: _count_tests(stats, surfaces, prims, k+1, first+count-k-1, -1)
+                    return True
+            continue
+        stack.append(node_right[node])
+        stack.append(node_left[node])
+    return False
+
+def closest_stats(ks, ex, ey, ez, dx, dy, dz, tmax):
+    ''' closest, counting hit and traversal time into ks.stats '''
+    stats = ks.stats
+    time_beg = time.perf_counter()
+    hit = closest(ks, ex, ey, ez, dx, dy, dz, tmax)
+    stats.traversal_time += time.perf_counter() - time_beg
+    stats.hits += hit is not None
+    return hit
+
+def any_hit_stats(ks, ex, ey, ez, dx, dy, dz, tmax):
+    ''' any_hit of a shadow ray, counting ray, occlusion, and traversal time into ks.stats '''
+    stats = ks.stats
+    time_beg = time.perf_counter()
+    blocked = any_hit(ks, ex, ey, ez, dx, dy, dz, tmax)
+    stats.traversal_time += time.perf_counter() - time_beg
+    stats.shadow_rays += 1
+    stats.occluded += blocked
+    return blocked
+
+
+def irradiance(ks, ex, ey, ez, dx, dy, dz, bounce=0, throughput=None, counts=None):
+    '''
+    returns (r,g,b) irradiance from scene (KernelScene) along ray (e,d) (reversed), where d is normalized
+    bounce is number of reflection bounces before ray; throughput is (r,g,b) product of reflection
+    coefficients along those bounces (None for camera rays).  Reflection rays whose throughput is
+    not above cutoff are skipped (and counted in counts, if given).
+    '''
+    if ks.stats is None:
+        hit = closest(ks, ex, ey, ez, dx, dy, dz, float_inf)
+    else:
+        hit = closest_stats(ks, ex, ey, ez, dx, dy, dz, float_inf)
+    if hit is None:
+        return ks.background
+    return shade(ks, ex, ey, ez, dx, dy, dz, hit[0], hit[1], bounce, throughput, counts)
+
+def shade(ks, ex, ey, ez, dx, dy, dz, t, i, bounce=0, throughput=None, counts=None):
+    ''' returns (r,g,b) irradiance leaving hit (t, surface index i) of ray (e,d) toward ray origin '''
+    px,py,pz = ex + dx * t, ey + dy * t, ez + dz * t
+    s = ks.surfaces[i]
+    if s[0] == SURFACE_QUAD:
+        nx,ny,nz = s[4],s[5],s[6]
+    else:
+        nx,ny,nz = _normalized3(px - s[1], py - s[2], pz - s[3])
+    (kdr,kdg,kdb),(ksr,ksg,ksb),mn,kr = ks.materials[i]
+
+    ar,ag,ab = ks.ambient
+    cr,cg,cb = 0 + ar * kdr, 0 + ag * kdg, 0 + ab * kdb
+    # v = -ray.d (the object engine's Direction.__neg__ re-normalizes)
+    vx,vy,vz = _normalized3(-dx, -dy, -dz)
+    shadow = any_hit if ks.stats is None else any_hit_stats
+    for lox,loy,loz,lzx,lzy,lzz,(lir,lig,lib),is_point in ks.lights:
+        sx,sy,sz = lox - px, loy - py, loz - pz
+        lsq = sx*sx + sy*sy + sz*sz
+        dist = sqrt(lsq)
+        ldx,ldy,ldz = _normalized3(sx, sy, sz)
+        if shadow(ks, px, py, pz, ldx, ldy, ldz, dist):
+            continue
+        if is_point:
+            rr,rg,rb = lir / lsq, lig / lsq, lib / lsq
+            lx,ly,lz = sx / dist, sy / dist, sz / dist
+        else:
+            rr,rg,rb = lir,lig,lib
+            lx,ly,lz = lzx,lzy,lzz
+        hx,hy,hz = ldx + vx, ldy + vy, ldz + vz
+        hl = sqrt(hx*hx + hy*hy + hz*hz)
+        hx,hy,hz = hx / hl, hy / hl, hz / hl
+        spec = max(0, nx*hx + ny*hy + nz*hz) ** mn
+        cos = max(0, nx*lx + ny*ly + nz*lz)
+        cr += (kdr + spec * ksr) * rr * cos
+        cg += (kdg + spec * ksg) * rg * cos
+        cb += (kdb + spec * ksb) * rb * cos
+
+    if bounce < ks.max_bounces:
+        if throughput is None:
+            throughput = kr
+        else:
+            throughput = (throughput[0] * kr[0], throughput[1] * kr[1], throughput[2] * kr[2])
+        if max(throughput) > ks.reflection_cutoff:
+            # rd = -v + 2 * (v.dot(n)) * n, where -v is re-normalized again
+            mx,my,mz = _normalized3(-vx, -vy, -vz)
+            f = 2 * (vx*nx + vy*ny + vz*nz)
+            rx,ry,rz = _normalized3(mx + f * nx, my + f * ny, mz + f * nz)
+            if ks.stats is not None: ks.stats.reflection_rays += 1
+            rr,rg,rb = irradiance(ks, px, py, pz, rx, ry, rz, bounce + 1, throughput, counts)
+            cr += rr * kr[0]
+            cg += rg * kr[1]
+            cb += rb * kr[2]
+        elif counts is not None:
+            counts['reflection_rays_skipped'] = counts.get('reflection_rays_skipped', 0) + 1
+
+    return cr,cg,cb
+
+
+def camera(scene):
+    ''' returns camera of scene (RenderScene) as floats (ox,oy,oz, x, y, z, width, height, dist), axes as tuples '''
+    cam = scene.camera
+    f = cam.frame
+    return (f.o.x, f.o.y, f.o.z, f.x.xyz, f.y.xyz, f.z.xyz, cam.width, cam.height, cam.dist)
+
+def camera_ray(cam, W, H, col, row, col2=0, row2=0, samples=1):
+    ''' returns normalized direction (dx,dy,dz) of camera ray through sample (col2,row2) of pixel (col,row) '''
+    ox,oy,oz,(xx,xy,xz),(yx,yy,yz),(zx,zy,zz),w,h,d = cam
+    u = (col + (col2 + 0.5) / samples) / W
+    v = 1 - (row + (row2 + 0.5) / samples) / H
+    a,b = (u - 0.5) * w,(v - 0.5) * h
+    qx = ox + a * xx + b * yx - d * zx
+    qy = oy + a * xy + b * yy - d * zy
+    qz = oz + a * xz + b * yz - d * zz
+    return _normalized3(qx - ox, qy - oy, qz - oz)
+
+
+def adaptive_pixel(ks, cam, W, H, col, row, samples, threshold, counts=None):
+    '''
+    returns ((r,g,b), number of samples) of pixel (col,row) using adaptive anti-aliasing
+    (see `adaptive_pixel` in P02_Raytrace.py, which this matches exactly)
+    '''
+    ox,oy,oz = cam[0],cam[1],cam[2]
+    corners = {}
+    surfaces = set()
+    find = closest if ks.stats is None else closest_stats
+    for col2 in (0, samples - 1):
+        for row2 in (0, samples - 1):
+            dx,dy,dz = camera_ray(cam, W, H, col, row, col2, row2, samples)
+            hit = find(ks, ox, oy, oz, dx, dy, dz, float_inf)
+            if hit is None:
+                corners[col2, row2] = ks.background
+                surfaces.add(None)
+            else:
+                corners[col2, row2] = shade(ks, ox, oy, oz, dx, dy, dz, hit[0], hit[1], 0, None, counts)
+                surfaces.add(hit[1])
+
+    colors = list(corners.values())
+    refine = len(surfaces) > 1
+    for c in range(3):
+        if refine: break
+        vals = [color[c] for color in colors]
+        refine = max(vals) - min(vals) > threshold
+
+    cr = cg = cb = 0
+    if not refine:
+        for r,g,b in colors:
+            cr,cg,cb = cr + r, cg + g, cb + b
+        n = len(colors)
+        return (cr / n, cg / n, cb / n), n
+
+    for col2 in range(samples):
+        for row2 in range(samples):
+            if (col2, row2) in corners:
+                r,g,b = corners[col2, row2]
+            else:
+                dx,dy,dz = camera_ray(cam, W, H, col, row, col2, row2, samples)
+                r,g,b = irradiance(ks, ox, oy, oz, dx, dy, dz, 0, None, counts)
+            cr,cg,cb = cr + r, cg + g, cb + b
+    n = samples ** 2
+    return (cr / n, cg / n, cb / n), n
+
+
+def raytrace_tile(scene, tile, options):
+    '''
+    computes pixels of tile (col0,row0,col1,row1) of image of scene (RenderScene or KernelScene)
+    returns (pixels, counts) exactly like `raytrace_tile` in P02_Raytrace.py
+    '''
+    ks = prepare(scene)
+    scene = ks.scene
+    cam = camera(scene)
+    ox,oy,oz = cam[0],cam[1],cam[2]
+    W,H,ps = scene.resolution_width,scene.resolution_height,scene.pixel_samples
+    col0, row0, col1, row1 = tile
+
+    samples = options.aa_max_samples or ps
+    adaptive = options.adaptive_aa and samples > 1
+    counts = {'camera_rays': 0, 'reflection_rays_skipped': 0}
+
+    pixels = []
+    num_samples = 0
+    for row in range(row0, row1):
+        pixels_row = []
+        for col in range(col0, col1):
+            if adaptive:
+                (cr,cg,cb), n = adaptive_pixel(ks, cam, W, H, col, row, samples, options.aa_threshold, counts)
+                num_samples += n
+            elif ps == 1:
+                dx,dy,dz = camera_ray(cam, W, H, col, row)
+                cr,cg,cb = irradiance(ks, ox, oy, oz, dx, dy, dz, 0, None, counts)
+                num_samples += 1
+            else:
+                cr = cg = cb = 0
+                for col2 in range(ps):
+                    for row2 in range(ps):
+                        dx,dy,dz = camera_ray(cam, W, H, col, row, col2, row2, ps)
+                        r,g,b = irradiance(ks, ox, oy, oz, dx, dy, dz, 0, None, counts)
+                        cr,cg,cb = cr + r, cg + g, cb + b
+                n = ps ** 2
+                cr,cg,cb = cr / n, cg / n, cb / n
+                num_samples += n
+            pixels_row += [cr, cg, cb, 1]
+        pixels.append(pixels_row)
+    counts['camera_rays'] = num_samples
+    return pixels, counts
+
+def time_camera_rays(ks, tile, options, num_rays):
+    ''' returns estimated seconds to generate num_rays camera rays of tile, timed by generating each sample's camera ray once '''
+    scene = ks.scene
+    cam = camera(scene)
+    W,H,ps = scene.resolution_width,scene.resolution_height,scene.pixel_samples
+    col0, row0, col1, row1 = tile
+    samples = (options.aa_max_samples or ps) if options.adaptive_aa else ps
+    time_beg = time.perf_counter()
+    for row in range(row0, row1):
+        for col in range(col0, col1):
+            for col2 in range(samples):
+                for row2 in range(samples):
+                    camera_ray(cam, W, H, col, row, col2, row2, samples)
+    generated = (row1 - row0) * (col1 - col0) * samples * samples
+    return (time.perf_counter() - time_beg) * num_rays / max(1, generated)
@@ -21,6 +21,20 @@ def radians(deg): return deg * pi / 180.0
 def degrees(rad): return rad * 180.0 / pi
 
 
+def _normalized3(x, y, z):
+    ''' returns (x,y,z) normalized exactly like `Vector.normalize` '''
+    lsqrd = x*x + y*y + z*z
+    if lsqrd == 0: return x,y,z
+    l = lsqrd if abs(lsqrd-1) < 0.0000001 else sqrt(lsqrd)
+    return x/l, y/l, z/l
+
+def _direction(x, y, z):
+    ''' returns Direction with given components, which must already be normalized (not checked) '''
+    d = Direction.__new__(Direction)
+    d.x,d.y,d.z = x,y,z
+    return d
+
+
 class Vector:
     '''
     Generalized 3-dimensional vector (x,y,z)
@@ -239,17 +253,34 @@ class Normal(Vector):
 class Ray:
     '''
     A class representing a ray in 3D space (origin and direction)
+
+    Ray(e, d, ...) copies e and d (normalizing d) and measures min and
+    max in world units.  Ray.from_normalized(e, d, ...) is a fast,
+    trusted constructor: e is a Point and d is an already-normalized
+    Direction, both stored without copying, and min_dist/max_dist are
+    stored as given.  from_segment and from_segment_no_max use it.
     '''
 
     __slots__ = ['e', 'd', 'min', 'max']
 
     @staticmethod
     def from_segment(a:Point, b:Point):
-        return Ray(e=a, d=Direction(b - a), max_dist=(b - a).length)
+        dx,dy,dz = b.x-a.x, b.y-a.y, b.z-a.z
+        l = sqrt(dx*dx + dy*dy + dz*dz)
+        return Ray.from_normalized(a, _direction(*_normalized3(dx, dy, dz)), max_dist=l)
 
     @staticmethod
     def from_segment_no_max(a:Point, b:Point):
-        return Ray(e=a, d=Direction(b - a))
+        return Ray.from_normalized(a, _direction(*_normalized3(b.x-a.x, b.y-a.y, b.z-a.z)))
+
+    @staticmethod
+    def from_normalized(e:Point, d:Direction, min_dist:float=0.00005, max_dist:float=float_inf):
+        ray = Ray.__new__(Ray)
+        ray.e = e
+        ray.d = d
+        ray.min = min_dist
+        ray.max = max_dist
+        return ray
 
     def __init__(self, e:Point, d:Direction, min_dist:float=0.00005, max_dist:float=float_inf):
         self.e = Point(e)
@@ -283,15 +314,34 @@ class Frame:
     The w2l_typed and l2w_typed functions call the appropriate
     transformation function based on the type of given parameter.
     Note: there is a performance penalty here, so try calling the
-    appropriate function when possible.
+    appropriate function when possible.  The dispatch tables
+    (fn_l2w_typed, fn_w2l_typed) are shared by all frames.
+
+    Frame.from_z(o, z) is a fast constructor for the common case of an
+    origin and a z axis that is already a normalized Direction (ex: a
+    shading frame).  It gives exactly the same frame as Frame(o=o, z=z).
     '''
 
-    __slots__ = ['o','x','y','z','fn_l2w_typed','fn_w2l_typed']
+    __slots__ = ['o','x','y','z']
 
     @staticmethod
     def lookat(eye:Point, center:Point, up:Direction, flipped:bool=True):
         return Frame(o=eye, y=up, z=Direction(center-eye) * (-1 if flipped else 1))
 
+    @staticmethod
+    def from_z(o:Point, z:Direction):
+        # same arithmetic as the z-only case of __init__, on floats
+        zx,zy,zz = z.x,z.y,z.z
+        ax,ay,az = _normalized3(-zx + 3.14, zy + 42, zz - 1.61)
+        yx,yy,yz = _normalized3(-(ay*zz-az*zy), -(az*zx-ax*zz), -(ax*zy-ay*zx))
+        xx,xy,xz = _normalized3(yy*zz-yz*zy, yz*zx-yx*zz, yx*zy-yy*zx)
+        frame = Frame.__new__(Frame)
+        frame.o = o or Point()
+        frame.x = _direction(xx, xy, xz)
+        frame.y = _direction(yx, yy, yz)
+        frame.z = z
+        return frame
+
     def __init__(self, o:Point=None, x:Direction=None, y:Direction=None, z:Direction=None):
         c = (1 if x else 0) + (1 if y else 0) + (1 if z else 0)
         if c == 0:
@@ -331,21 +381,6 @@ class Frame:
         self.y = y
         self.z = z
 
-        self.fn_l2w_typed = {
-            Point:      self.l2w_point,
-            Direction:  self.l2w_direction,
-            Normal:     self.l2w_normal,
-            Vector:     self.l2w_vector,
-            Ray:        self.l2w_ray,
-        }
-        self.fn_w2l_typed = {
-            Point:      self.w2l_point,
-            Direction:  self.w2l_direction,
-            Normal:     self.w2l_normal,
-            Vector:     self.w2l_vector,
-            Ray:        self.w2l_ray,
-        }
-
     def __repr__(self):
         return '<Frame o:(%0.4f, %0.4f, %0.4f), x:(%0.4f, %0.4f, %0.4f), y:(%0.4f, %0.4f, %0.4f), z:(%0.4f, %0.4f, %0.4f)>' % (
             self.o.x,self.o.y,self.o.z,
@@ -361,12 +396,12 @@ class Frame:
         ''' dispatched conversion '''
         t = type(data)
         assert t in self.fn_l2w_typed, "unhandled type of data: %s (%s)" % (str(data), str(type(data)))
-        return self.fn_l2w_typed[t](data)
+        return self.fn_l2w_typed[t](self, data)
     def w2l_typed(self, data):
         ''' dispatched conversion '''
         t = type(data)
         assert t in self.fn_w2l_typed, "unhandled type of data: %s (%s)" % (str(data), str(type(data)))
-        return self.fn_w2l_typed[t](data)
+        return self.fn_w2l_typed[t](self, data)
 
     def w2l_point(self, p:Point)->Point: return Point(self._dots(p - self.o))
     def l2w_point(self, p:Point)->Point: return Point(self.o + self._mults(p))
@@ -397,3 +432,18 @@ class Frame:
         self.x = +x*c + y*s
         self.y = -x*s + y*c
 
+# dispatch tables for l2w_typed and w2l_typed (type of data -> unbound method)
+Frame.fn_l2w_typed = {
+    Point:      Frame.l2w_point,
+    Direction:  Frame.l2w_direction,
+    Normal:     Frame.l2w_normal,
+    Vector:     Frame.l2w_vector,
+    Ray:        Frame.l2w_ray,
+}
+Frame.fn_w2l_typed = {
+    Point:      Frame.w2l_point,
+    Direction:  Frame.w2l_direction,
+    Normal:     Frame.w2l_normal,
+    Vector:     Frame.w2l_vector,
+    Ray:        Frame.w2l_ray,
+}
@@ -0,0 +1,46 @@
+'''
+The following class stores options that control how a scene is rendered
+(as opposed to what is rendered, which is stored in the Scene).
+
+Like the scene classes, every option has a default value so the type of
+the option can be discovered.
+'''
+
+
+# render engines
+ENGINE_SCALAR = 'scalar'    # one ray at a time, in Python (P02_Raytrace.py)
+ENGINE_FAST   = 'fast'      # one ray at a time, in Python on plain floats (common/kernels.py)
+ENGINE_NUMPY  = 'numpy'     # all camera rays at once, in NumPy (common/wavefront.py)
+ENGINES = [ENGINE_SCALAR, ENGINE_FAST, ENGINE_NUMPY]
+
+# tile schedulers (workers > 1)
+SCHEDULER_STEAL = 'steal'   # cost-ordered tiles, idle workers steal (common/scheduler.py)
+SCHEDULER_POOL  = 'pool'    # tiles in row-major order through multiprocessing.Pool
+SCHEDULERS = [SCHEDULER_STEAL, SCHEDULER_POOL]
+
+
+class RenderOptions:
+    __slots__ = [
+        'engine','workers','tile_size','scheduler','prepass_samples',
+        'shared_framebuffer','framebuffer_float32',
+        'adaptive_aa','aa_threshold','aa_max_samples',
+        'stream','png_compression','png_threads',
+        'stats','stats_json','trace',
+        ]
+    def __init__(self):
+        self.engine    = ENGINE_SCALAR  # render engine (see ENGINES)
+        self.workers   = 1              # worker processes rendering tiles (scalar and fast engines)
+        self.tile_size = 16             # width and height of tiles rendered by workers
+        self.scheduler = SCHEDULER_STEAL    # how tiles are distributed to workers (see SCHEDULERS)
+        self.prepass_samples = 2            # pre-pass rays per tile in x and y to predict tile cost (steal)
+        self.shared_framebuffer  = True     # workers write pixels into a SharedImage (workers > 1)
+        self.framebuffer_float32 = False    # SharedImage stores float32 (False: float64, exact)
+        self.adaptive_aa    = False         # trace corner samples first; refine pixel only if they differ
+        self.aa_threshold   = 1 / 255       # max difference of corner sample channels before refining
+        self.aa_max_samples = 0             # samples per pixel in x and y when refining (0: scene.pixel_samples)
+        self.stream         = False         # write rows to the image file as they are completed (main)
+        self.png_compression = -1           # zlib level of image file: 0 (fast) to 9 (small), -1: default
+        self.png_threads     = 1            # threads compressing the image file (see png.ParallelCompressor)
+        self.stats           = False        # count rays, tests, and phase times (see common/stats.py)
+        self.stats_json      = None         # filename to write stats of each scene to as JSON (main)
+        self.trace           = None         # filename to write Chrome trace-event JSON of all renders to (main; see common/trace.py)
@@ -151,6 +151,7 @@ import math
 import re
 # http://www.python.org/doc/2.4.4/lib/module-operator.html
 import operator
+import os
 import struct
 import sys
 # http://www.python.org/doc/2.4.4/lib/module-warnings.html
@@ -158,6 +159,8 @@ import warnings
 import zlib
 
 from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 
 try:
@@ -170,6 +173,13 @@ try:
 except ImportError:
     pass
 
+try:
+    # NumPy is optional.  When it is available, `Writer.write` encodes
+    # NumPy arrays without per-byte Python loops (see `write_ndarray`).
+    import numpy as np
+except ImportError:
+    np = None
+
 
 __all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array']
 
@@ -194,7 +204,7 @@ def isarray(x):
     return isinstance(x, array)
 
 def tostring(row):
-    return row.tostring()
+    return row.tobytes()
 
 def interleave_planes(ipixels, apixels, ipsize, apsize):
     """
@@ -338,6 +348,9 @@ class Writer:
                  colormap=None,
                  maxval=None,
                  chunk_limit=2**20,
+                 filter_type=0,
+                 flush_rows=None,
+                 compression_threads=None,
                  x_pixels_per_unit = None,
                  y_pixels_per_unit = None,
                  unit_is_meter = False):
@@ -371,6 +384,14 @@ class Writer:
           Create an interlaced image.
         chunk_limit
           Write multiple ``IDAT`` chunks to save memory.
+        filter_type
+          Scanline filter: 0 (none), 1 (sub), 2 (up), 3 (average),
+          4 (paeth), or 'adaptive' (best filter chosen per row).
+        flush_rows
+          Write out compressed data every `flush_rows` rows.
+        compression_threads
+          Compress with this many threads (see
+          :class:`ParallelCompressor`).
         x_pixels_per_unit
           Number of pixels a unit along the x axis (write a
           `pHYs` chunk).
@@ -470,6 +491,27 @@ class Writer:
         `chunk_limit` is used to limit the amount of memory used whilst
         compressing the image.  In order to avoid using large amounts of
         memory, multiple ``IDAT`` chunks may be created.
+
+        `filter_type` selects the scanline filter applied to every row
+        before compression (see http://www.w3.org/TR/PNG/#9Filters).
+        Filters often make the image compress better.  With 'adaptive',
+        each row uses the filter that gives the smallest sum of absolute
+        (signed) filtered bytes, with ties going to the lower filter type.
+        Interlaced images are always written with filter 0.
+
+        `flush_rows` makes :meth:`write_passes` write out all the rows
+        given so far every `flush_rows` rows: the compressed stream is
+        ended with a zlib sync flush, written as an ``IDAT`` chunk, and
+        `outfile` is flushed.  Use it when rows are produced slowly (ex:
+        while rendering), so that a file cut short still holds every
+        row written so far.  Each flush costs a few bytes.
+
+        With `compression_threads` greater than 1, the ``IDAT`` data is
+        compressed in independent segments by a pool of threads (see
+        :class:`ParallelCompressor`).  The result is a single zlib
+        stream that decodes to the same bytes, slightly larger than
+        the single-threaded one.  `compression` still sets the level:
+        lower levels are faster, higher levels compress better.
         """
 
         # At the moment the `planes` argument is ignored;
@@ -546,6 +588,10 @@ class Writer:
             raise ValueError(
                 "bit depth must be 8 or less for images with palette")
 
+        if filter_type not in (0, 1, 2, 3, 4, 'adaptive'):
+            raise ValueError(
+                "filter_type must be 0, 1, 2, 3, 4, or 'adaptive'")
+
         transparent = check_color(transparent, greyscale, 'transparent')
         background = check_color(background, greyscale, 'background')
 
@@ -563,6 +609,9 @@ class Writer:
         self.bitdepth = int(bitdepth)
         self.compression = compression
         self.chunk_limit = chunk_limit
+        self.filter_type = filter_type
+        self.flush_rows = flush_rows
+        self.compression_threads = compression_threads
         self.interlace = bool(interlace)
         self.palette = palette
         self.x_pixels_per_unit = x_pixels_per_unit
@@ -612,6 +661,11 @@ class Writer:
           memory.
         """
 
+        if np is not None and isinstance(rows, np.ndarray) and \
+          not self.interlace and not self.rescale and \
+          self.bitdepth in (8, 16):
+            return self.write_ndarray(outfile, rows)
+
         if self.interlace:
             fmt = 'BH'[self.bitdepth > 8]
             a = array(fmt, itertools.chain(*rows))
@@ -642,68 +696,10 @@ class Writer:
         sequence of bytes.
         """
 
-        # http://www.w3.org/TR/PNG/#5PNG-file-signature
-        outfile.write(_signature)
-
-        # http://www.w3.org/TR/PNG/#11IHDR
-        write_chunk(outfile, b'IHDR',
-                    struct.pack("!2I5B", self.width, self.height,
-                                self.bitdepth, self.color_type,
-                                0, 0, self.interlace))
-
-        # See :chunk:order
-        # http://www.w3.org/TR/PNG/#11gAMA
-        if self.gamma is not None:
-            write_chunk(outfile, b'gAMA',
-                        struct.pack("!L", int(round(self.gamma*1e5))))
-
-        # See :chunk:order
-        # http://www.w3.org/TR/PNG/#11sBIT
-        if self.rescale:
-            write_chunk(outfile, b'sBIT',
-                struct.pack('%dB' % self.planes,
-                            *[self.rescale[0]]*self.planes))
-
-        # :chunk:order: Without a palette (PLTE chunk), ordering is
-        # relatively relaxed.  With one, gAMA chunk must precede PLTE
-        # chunk which must precede tRNS and bKGD.
-        # See http://www.w3.org/TR/PNG/#5ChunkOrdering
-        if self.palette:
-            p,t = self.make_palette()
-            write_chunk(outfile, b'PLTE', p)
-            if t:
-                # tRNS chunk is optional. Only needed if palette entries
-                # have alpha.
-                write_chunk(outfile, b'tRNS', t)
-
-        # http://www.w3.org/TR/PNG/#11tRNS
-        if self.transparent is not None:
-            if self.greyscale:
-                write_chunk(outfile, b'tRNS',
-                            struct.pack("!1H", *self.transparent))
-            else:
-                write_chunk(outfile, b'tRNS',
-                            struct.pack("!3H", *self.transparent))
-
-        # http://www.w3.org/TR/PNG/#11bKGD
-        if self.background is not None:
-            if self.greyscale:
-                write_chunk(outfile, b'bKGD',
-                            struct.pack("!1H", *self.background))
-            else:
-                write_chunk(outfile, b'bKGD',
-                            struct.pack("!3H", *self.background))
-
-        # http://www.w3.org/TR/PNG/#11pHYs
-        if self.x_pixels_per_unit is not None and self.y_pixels_per_unit is not None:
-            tup = (self.x_pixels_per_unit, self.y_pixels_per_unit, int(self.unit_is_meter))
-            write_chunk(outfile, b'pHYs', struct.pack("!LLB",*tup))
+        self.write_header(outfile)
 
         # http://www.w3.org/TR/PNG/#11IDAT
-        if self.compression is not None:
-            compressor = zlib.compressobj(self.compression)
-        else:
-            compressor = zlib.compressobj()
+        compressor = self.make_compressor()
 
         # Choose an extend function based on the bitdepth.  The extend
         # function packs/decomposes the pixel values into bytes and
@@ -748,6 +744,25 @@ class Writer:
         enumrows = enumerate(rows)
         del rows
 
+        # Rows are written unfiltered (filter type 0) unless a filter
+        # was requested.  Interlaced images always use filter type 0:
+        # we do not mark the first row of a reduced pass image, so we
+        # could compute the wrong filtered scanline if we used "up",
+        # "average", or "paeth" on such a line.
+        filter_type = 0 if self.interlace else self.filter_type
+        if filter_type != 0:
+            fo = max(1, self.planes * self.bitdepth // 8)
+            prev = [None]
+            def refilter(start):
+                # Replace the unfiltered row at data[start:] (filter
+                # type byte, then scanline) with the filtered row.
+                line = data[start+1:]
+                if filter_type == 'adaptive':
+                    data[start:] = filter_scanline_adaptive(line, fo, prev[0])
+                else:
+                    data[start:] = filter_scanline(filter_type, line, fo, prev[0])
+                prev[0] = line
+
         # First row's filter type.
         data.append(0)
         # :todo: Certain exceptions in the call to ``.next()`` or the
@@ -767,19 +782,24 @@ class Writer:
             extend = wrapmapint(extend)
             del wrapmapint
             extend(row)
+        if filter_type != 0:
+            refilter(0)
 
         for i,row in enumrows:
-            # Add "None" filter type.  Currently, it's essential that
-            # this filter type be used for every scanline as we do not
-            # mark the first row of a reduced pass image; that means we
-            # could accidentally compute the wrong filtered scanline if
-            # we used "up", "average", or "paeth" on such a line.
+            start = len(data)
             data.append(0)
             extend(row)
-            if len(data) > self.chunk_limit:
+            if filter_type != 0:
+                refilter(start)
+            flush = self.flush_rows and (i+1) % self.flush_rows == 0
+            if len(data) > self.chunk_limit or flush:
                 compressed = compressor.compress(tostring(data))
+                if flush:
+                    compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
                 if len(compressed):
                     write_chunk(outfile, b'IDAT', compressed)
+                if flush:
+                    outfile.flush()
                 # Because of our very witty definition of ``extend``,
                 # above, we must re-use the same ``data`` object.  Hence
                 # we use ``del`` to empty this one, rather than create a
@@ -796,6 +816,143 @@ class Writer:
         write_chunk(outfile, b'IEND')
         return i+1
 
+    def make_compressor(self):
+        """
+        Return the compressor for the ``IDAT`` data: a zlib compression
+        object, or a :class:`ParallelCompressor` (which has the same
+        `compress` and `flush` methods) if `compression_threads` is
+        greater than 1.
+        """
+
+        if self.compression_threads and self.compression_threads > 1:
+            return ParallelCompressor(self.compression, self.compression_threads)
+        if self.compression is not None:
+            return zlib.compressobj(self.compression)
+        return zlib.compressobj()
+
+    def write_header(self, outfile):
+        """
+        Write the PNG signature and all chunks that precede the
+        ``IDAT`` chunks to the output file.
+        """
+
+        # http://www.w3.org/TR/PNG/#5PNG-file-signature
+        outfile.write(_signature)
+
+        # http://www.w3.org/TR/PNG/#11IHDR
+        write_chunk(outfile, b'IHDR',
+                    struct.pack("!2I5B", self.width, self.height,
+                                self.bitdepth, self.color_type,
+                                0, 0, self.interlace))
+
+        # See :chunk:order
+        # http://www.w3.org/TR/PNG/#11gAMA
+        if self.gamma is not None:
+            write_chunk(outfile, b'gAMA',
+                        struct.pack("!L", int(round(self.gamma*1e5))))
+
+        # See :chunk:order
+        # http://www.w3.org/TR/PNG/#11sBIT
+        if self.rescale:
+            write_chunk(outfile, b'sBIT',
+                struct.pack('%dB' % self.planes,
+                            *[self.rescale[0]]*self.planes))
+
+        # :chunk:order: Without a palette (PLTE chunk), ordering is
+        # relatively relaxed.  With one, gAMA chunk must precede PLTE
+        # chunk which must precede tRNS and bKGD.
+        # See http://www.w3.org/TR/PNG/#5ChunkOrdering
+        if self.palette:
+            p,t = self.make_palette()
+            write_chunk(outfile, b'PLTE', p)
+            if t:
+                # tRNS chunk is optional. Only needed if palette entries
+                # have alpha.
+                write_chunk(outfile, b'tRNS', t)
+
+        # http://www.w3.org/TR/PNG/#11tRNS
+        if self.transparent is not None:
+            if self.greyscale:
+                write_chunk(outfile, b'tRNS',
+                            struct.pack("!1H", *self.transparent))
+            else:
+                write_chunk(outfile, b'tRNS',
+                            struct.pack("!3H", *self.transparent))
+
+        # http://www.w3.org/TR/PNG/#11bKGD
+        if self.background is not None:
+            if self.greyscale:
+                write_chunk(outfile, b'bKGD',
+                            struct.pack("!1H", *self.background))
+            else:
+                write_chunk(outfile, b'bKGD',
+                            struct.pack("!3H", *self.background))
+
+        # http://www.w3.org/TR/PNG/#11pHYs
+        if self.x_pixels_per_unit is not None and self.y_pixels_per_unit is not None:
+            tup = (self.x_pixels_per_unit, self.y_pixels_per_unit, int(self.unit_is_meter))
+            write_chunk(outfile, b'pHYs', struct.pack("!LLB",*tup))
+
+    def write_ndarray(self, outfile, a):
+        """
+        Write a PNG image from a NumPy array of integer values, shaped
+        (height, width*planes) or (height, width, planes), to the
+        output file.  The image must not be interlaced and its bit
+        depth must be 8 or 16.
+
+        Values are checked, packed, filtered (see `filter_type`), and
+        grouped into ``IDAT`` chunks with whole-array operations.  The
+        output is byte-identical to :meth:`write` given the same rows
+        as lists.
+        """
+
+        a = np.asarray(a).reshape(self.height, self.width * self.planes)
+        maxval = 2**self.bitdepth - 1
+        if a.dtype != np.uint8 and a.size and (a.min() < 0 or a.max() > maxval):
+            raise ValueError("pixel values must be between 0 and %d" % maxval)
+        fo = max(1, self.planes * self.bitdepth // 8)
+
+        def scanlines(start, end):
+            if self.bitdepth == 8:
+                return a[start:end].astype(np.uint8, copy=False)
+            return a[start:end].astype('>u2').view(np.uint8)
+
+        self.write_header(outfile)
+        compressor = self.make_compressor()
+
+        # Same IDAT chunking as :meth:`write_passes`: compress rows
+        # whenever more than `chunk_limit` bytes have accumulated
+        # (checked after each row but the first).  Each block of rows
+        # is packed and filtered as it is compressed, so memory use is
+        # bounded by `chunk_limit` rather than by the size of the image.
+        row_bytes = 1 + self.width * self.planes * self.bitdepth // 8
+        blocks = []
+        start,size = 0,row_bytes
+        for i in range(1, self.height):
+            size += row_bytes
+            if size > self.chunk_limit:
+                blocks.append((start, i+1))
+                start,size = i+1,0
+        blocks.append((start, self.height))
+
+        prev = None
+        for n,(start,end) in enumerate(blocks):
+            lines = scanlines(start, end)
+            compressed = b''
+            if len(lines):
+                compressed = compressor.compress(
+                    filter_scanlines_array(self.filter_type, lines, fo, prev).tobytes())
+                prev = lines[-1]
+            if n < len(blocks) - 1:
+                if len(compressed):
+                    write_chunk(outfile, b'IDAT', compressed)
+            else:
+                flushed = compressor.flush()
+                if len(compressed) or len(flushed):
+                    write_chunk(outfile, b'IDAT', compressed + flushed)
+        write_chunk(outfile, b'IEND')
+        return self.height
+
     def write_array(self, outfile, pixels):
         """
         Write an array in flat row flat pixel format as a PNG file on
@@ -962,6 +1119,116 @@ def write_chunks(out, chunks):
     for chunk in chunks:
         write_chunk(out, *chunk)
 
+class ParallelCompressor:
+    """
+    Compress data into a single zlib stream using a pool of threads,
+    like a compression object returned by :func:`zlib.compressobj`
+    (use `compress` as data arrives, then `flush`).
+
+    Data is cut into segments of `segment_size` bytes, and each segment
+    is compressed to raw deflate data by a thread (zlib releases the
+    GIL while compressing).  So that matches can still reach back into
+    the previous segment, each segment is compressed with the last 32
+    KiB of the previous segment as a preset dictionary.  Every segment
+    but the last ends with a sync flush (an empty stored block that
+    ends on a byte boundary), so the segments join into one deflate
+    stream; the zlib header and the Adler-32 checksum of all the data
+    are added around it.  The output does not depend on the number of
+    threads.
+
+    `level` is the zlib compression level (0 to 9, or -1 or ``None``
+    for the default); `threads` defaults to the number of CPUs.
+    """
+
+    # Deflate can refer back at most this many bytes
+    window = 2**15
+
+    def __init__(self, level=None, threads=None, segment_size=2**17):
+        self.level = -1 if level is None else level
+        self.segment_size = segment_size
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.dictionary = b''
+        self.adler = zlib.adler32(b'')
+        self.header = self.make_header(self.level)
+
+    @staticmethod
+    def make_header(level):
+        """Return the two byte zlib header (32 KiB window) for
+        compression `level`."""
+
+        # http://www.ietf.org/rfc/rfc1950.txt, FLEVEL as set by zlib
+        if level == -1:
+            flevel = 2
+        elif level < 2:
+            flevel = 0
+        elif level < 6:
+            flevel = 1
+        elif level == 6:
+            flevel = 2
+        else:
+            flevel = 3
+        cmf = 0x78
+        flg = flevel << 6
+        flg += 31 - (cmf * 256 + flg) % 31
+        return struct.pack('BB', cmf, flg)
+
+    def _compress_segment(self, data, dictionary, mode):
+        if dictionary:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                 zdict=dictionary)
+        else:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return c.compress(data) + c.flush(mode)
+
+    def _submit(self, data, mode):
+        self.adler = zlib.adler32(data, self.adler)
+        self.pending.append(self.executor.submit(
+            self._compress_segment, data, self.dictionary, mode))
+        self.dictionary = data[-self.window:]
+
+    def _collect(self, wait):
+        """Return the compressed output of the segments that are done,
+        in order (all of them if `wait` is true; otherwise, without
+        letting more than twice `threads` segments queue up)."""
+
+        out = [self.header]
+        self.header = b''
+        while self.pending and (wait or self.pending[0].done() or
+                                len(self.pending) > 2 * self.threads):
+            out.append(self.pending.popleft().result())
+        return b''.join(out)
+
+    def compress(self, data):
+        self.buffer += data
+        size = self.segment_size
+        if len(self.buffer) < size:
+            return b''
+        n = len(self.buffer) // size * size
+        for i in range(0, n, size):
+            self._submit(bytes(self.buffer[i:i+size]), zlib.Z_SYNC_FLUSH)
+        del self.buffer[:n]
+        return self._collect(False)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        """Compress the remaining data and return all the output not
+        yet returned.  With `mode` ``zlib.Z_SYNC_FLUSH`` the stream can
+        be continued; otherwise it is finished."""
+
+        if mode == zlib.Z_SYNC_FLUSH:
+            if self.buffer:
+                self._submit(bytes(self.buffer), zlib.Z_SYNC_FLUSH)
+                del self.buffer[:]
+            return self._collect(True)
+        self._submit(bytes(self.buffer), zlib.Z_FINISH)
+        del self.buffer[:]
+        out = self._collect(True) + struct.pack('!I', self.adler & 0xffffffff)
+        self.executor.shutdown()
+        return out
+
+
 def filter_scanline(type, line, fo, prev=None):
     """Apply a scanline filter to a scanline.  `type` specifies the
     filter type (0 to 4); `line` specifies the current (unfiltered)
@@ -1049,6 +1316,162 @@ def filter_scanline(type, line, fo, prev=None):
     return out
 
 
+def filter_scanline_adaptive(line, fo, prev=None):
+    """Apply the scanline filter (0 to 4) that gives the smallest sum
+    of absolute values of the filtered bytes (taken as signed bytes) to
+    a scanline.  Ties go to the lower filter type.  Arguments are as
+    for :func:`filter_scanline`.
+    """
+
+    best,best_cost = None,None
+    for type in range(5):
+        out = filter_scanline(type, line, fo, prev)
+        cost = sum(v if v < 128 else 256 - v for v in out[1:])
+        if best is None or cost < best_cost:
+            best,best_cost = out,cost
+    return best
+
+def filter_scanlines_array(type, lines, fo, prev=None):
+    """Apply a scanline filter to every scanline of an image at once,
+    using NumPy.  `lines` is a (height, bytes per row) array of uint8
+    (unfiltered, packed scanlines); `type` and `fo` are as for
+    :func:`filter_scanline` (`type` may also be 'adaptive', see
+    :func:`filter_scanline_adaptive`), and `prev` is the scanline
+    before the first one (None for the first scanline of the image),
+    so an image can be filtered a block of rows at a time.  Returns a
+    (height, 1 + bytes per row) array of uint8: each row is the filter
+    type byte followed by the filtered scanline, exactly as
+    :func:`filter_scanline` gives.
+    """
+
+    x = lines
+    height = x.shape[0]
+    # Bytes wrap around modulo 256 in uint8 arithmetic, as the filters
+    # require, so only the neighbours a filter uses are computed, each
+    # the size of `lines`; only Paeth needs wider (int16) values.
+    def left(v):
+        # byte fo to the left (zero off the left edge)
+        a = np.zeros_like(v)
+        a[:,fo:] = v[:,:-fo]
+        return a
+    def above():
+        # byte above (zero off the top of the image)
+        b = np.empty_like(x)
+        b[1:] = x[:-1]
+        b[0] = 0 if prev is None else prev
+        return b
+
+    def sub():
+        return x - left(x)
+    def up():
+        return x - above()
+    def average():
+        a,b = left(x),above()
+        # (a + b) >> 1 without overflowing a byte
+        return x - ((a >> 1) + (b >> 1) + (a & b & 1))
+    def paeth():
+        b = above()
+        c = left(b).astype(np.int16)
+        a = left(x).astype(np.int16)
+        b = b.astype(np.int16)
+        pa = np.abs(b - c)
+        pb = np.abs(a - c)
+        pc = np.abs(a + b - 2*c)
+        return x - np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c)).astype(np.uint8)
+    filters = (lambda: x, sub, up, average, paeth)
+
+    out = np.empty((height, x.shape[1] + 1), dtype=np.uint8)
+    if type == 'adaptive':
+        # score one candidate at a time, keeping the best so far
+        # (cost of a byte taken as a signed byte is min(v, 256 - v))
+        best_cost = None
+        for t,f in enumerate(filters):
+            v = f()
+            cost = np.minimum(v, np.negative(v)).sum(axis=1, dtype=np.int64)
+            if best_cost is None:
+                out[:,0] = t
+                out[:,1:] = v
+                best_cost = cost
+            else:
+                better = cost < best_cost
+                out[better,0] = t
+                out[better,1:] = v[better]
+                np.minimum(best_cost, cost, out=best_cost)
+    else:
+        out[:,0] = type
+        out[:,1:] = filters[type]()
+    return out
+
+
+def undo_filter_scanlines_array(types, lines, fo):
+    """Undo scanline filters of every scanline of an image, using
+    NumPy.  `types` is the (height,) array of filter types and `lines`
+    the (height, bytes per row) array of filtered scanlines (uint8);
+    `fo` is the filter offset (see :func:`filter_scanline`).  Returns
+    the (height, bytes per row) array of reconstructed scanlines.
+
+    Rows that use only "none", "sub", and "up" are reconstructed a row
+    at a time.  "average" and "paeth" depend on the reconstructed byte
+    to the left, above, and above-left, so when any row uses them, all
+    rows are reconstructed one anti-diagonal of pixels at a time (each
+    pixel on an anti-diagonal only depends on earlier anti-diagonals).
+    """
+
+    height,row_bytes = lines.shape
+    if height == 0 or row_bytes == 0:
+        return lines.copy()
+    types = np.asarray(types)
+    if types.max() > 4:
+        raise FormatError('Invalid PNG Filter Type.'
+          '  See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
+
+    if not np.isin(types, (3, 4)).any():
+        recon = np.empty_like(lines)
+        prev = np.zeros(row_bytes, dtype=np.uint8)
+        for y in range(height):
+            t = types[y]
+            if t == 0:
+                recon[y] = lines[y]
+            elif t == 2:
+                recon[y] = lines[y] + prev
+            else:
+                # sub: running sum of every fo-th byte (mod 256)
+                line = lines[y]
+                n = (row_bytes + fo - 1) // fo
+                padded = np.zeros(n * fo, dtype=np.uint8)
+                padded[:row_bytes] = line
+                padded = np.cumsum(padded.reshape(n, fo), axis=0, dtype=np.uint8)
+                recon[y] = padded.reshape(-1)[:row_bytes]
+            prev = recon[y]
+        return recon
+
+    # Pixels (filter units) per row; pad row to a whole number of units
+    n = (row_bytes + fo - 1) // fo
+    x = np.zeros((height, n * fo), dtype=np.int16)
+    x[:,:row_bytes] = lines
+    x = x.reshape(height, n, fo)
+    # recon[1+y, 1+i] is reconstructed unit i of row y; row 0 and
+    # column 0 are the zeros off the top and left of the image
+    recon = np.zeros((height + 1, n + 1, fo), dtype=np.int16)
+    for k in range(height + n - 1):
+        y = np.arange(max(0, k - n + 1), min(height, k + 1))
+        i = k - y
+        v = x[y, i]
+        a = recon[y + 1, i]
+        b = recon[y, i + 1]
+        c = recon[y, i]
+        pa = np.abs(b - c)
+        pb = np.abs(a - c)
+        pc = np.abs(a + b - 2*c)
+        pr = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        t = types[y][:,None]
+        v = v + np.select(
+          [t == 1, t == 2, t == 3, t == 4],
+          [a, b, (a + b) >> 1, pr], 0)
+        recon[y + 1, i + 1] = v & 0xff
+    return recon[1:,1:].reshape(height, n * fo)[:,:row_bytes].astype(np.uint8)
+
+
 # Regex for decoding mode string
 RegexModeDecode = re.compile("(LA?|RGBA?);?([0-9]*)", flags=re.IGNORECASE)
 
@@ -1189,6 +1612,7 @@ def from_array(a, mode=None, info={}):
     # In order to work out whether we the array is 2D or 3D we need its
     # first row, which requires that we take a copy of its iterator.
     # We may also need the first row to derive width and bitdepth.
+    rows = a if np is not None and isinstance(a, np.ndarray) else None
     a,t = itertools.tee(a)
     row = next(t)
     del t
@@ -1234,6 +1658,10 @@ def from_array(a, mode=None, info={}):
     for thing in ["width", "height", "bitdepth", "greyscale", "alpha"]:
         assert thing in info
 
+    if rows is not None:
+        # Keep NumPy arrays whole, so `Writer.write` can encode them
+        # with whole-array operations.
+        a = rows.reshape(info['height'], -1)
     return Image(a, info)
 
 # So that refugee's from PIL feel more at home.  Not documented.
@@ -1292,7 +1720,7 @@ class _readable:
     def read(self, n):
         r = self.buf[self.offset:self.offset+n]
         if isarray(r):
-            r = r.tostring()
+            r = r.tobytes()
         self.offset += n
         return r
 
@@ -1862,24 +2290,6 @@ class Reader:
         checksum failures will raise warnings rather than exceptions.
         """
 
-        def iteridat():
-            """Iterator that yields all the ``IDAT`` chunks as strings."""
-            while True:
-                try:
-                    type, data = self.chunk(lenient=lenient)
-                except ValueError as e:
-                    raise ChunkError(e.args[0])
-                if type == b'IEND':
-                    # http://www.w3.org/TR/PNG/#11IEND
-                    break
-                if type != b'IDAT':
-                    continue
-                # type == b'IDAT'
-                # http://www.w3.org/TR/PNG/#11IDAT
-                if self.colormap and not self.plte:
-                    warnings.warn("PLTE chunk is required before IDAT chunk")
-                yield data
-
         def iterdecomp(idat):
             """Iterator that yields decompressed strings.  `idat` should
             be an iterator that yields the ``IDAT`` chunk data.
@@ -1898,7 +2308,7 @@ class Reader:
             yield array('B', d.flush())
 
         self.preamble(lenient=lenient)
-        raw = iterdecomp(iteridat())
+        raw = iterdecomp(self.iteridat(lenient=lenient))
 
         if self.interlace:
             raw = array('B', itertools.chain(*raw))
@@ -1909,6 +2319,31 @@ class Reader:
                        *[iter(self.deinterlace(raw))]*self.width*self.planes)
         else:
             pixels = self.iterboxed(self.iterstraight(raw))
+        return self.width, self.height, pixels, self.metadata()
+
+    def iteridat(self, lenient=False):
+        """Iterator that yields all the ``IDAT`` chunks as strings."""
+        while True:
+            try:
+                type, data = self.chunk(lenient=lenient)
+            except ValueError as e:
+                raise ChunkError(e.args[0])
+            if type == b'IEND':
+                # http://www.w3.org/TR/PNG/#11IEND
+                break
+            if type != b'IDAT':
+                continue
+            # type == b'IDAT'
+            # http://www.w3.org/TR/PNG/#11IDAT
+            if self.colormap and not self.plte:
+                warnings.warn("PLTE chunk is required before IDAT chunk")
+            yield data
+
+    def metadata(self):
+        """Returns the *metadata* dictionary of the source image, as
+        returned by :meth:`read`.  The preamble must have been read.
+        """
+
         meta = dict()
         for attr in 'greyscale alpha planes bitdepth interlace'.split():
             meta[attr] = getattr(self, attr)
@@ -1919,7 +2354,69 @@ class Reader:
                 meta[attr] = a
         if self.plte:
             meta['palette'] = self.palette()
-        return self.width, self.height, pixels, meta
+        return meta
+
+    def read_array(self, lenient=False):
+        """
+        Read the PNG file and decode it with NumPy.  Returns
+        (`width`, `height`, `pixels`, `metadata`) like :meth:`read`,
+        but `pixels` is a (height, width, planes) NumPy array (uint8
+        for bit depths up to 8, uint16 for 16).
+
+        Filters are undone and Adam7 passes are deinterlaced with
+        whole-array operations (see :func:`undo_filter_scanlines_array`).
+        Requires NumPy.
+        """
+
+        self.preamble(lenient=lenient)
+        d = zlib.decompressobj()
+        raw = b''.join(d.decompress(data) for data in self.iteridat(lenient=lenient))
+        raw = np.frombuffer(raw + d.flush(), dtype=np.uint8)
+
+        planes = self.planes
+        if not self.interlace:
+            passes = [(0, 0, 1, 1)]
+        else:
+            passes = _adam7
+        dtype = np.uint16 if self.bitdepth > 8 else np.uint8
+        pixels = np.zeros((self.height, self.width, planes), dtype=dtype)
+        fo = max(1, planes * self.bitdepth // 8)
+        offset = 0
+        for xstart, ystart, xstep, ystep in passes:
+            if xstart >= self.width or ystart >= self.height:
+                continue
+            # Size of (reduced pass) image, and of its rows in bytes
+            ppr = (self.width - xstart + xstep - 1) // xstep
+            rows = (self.height - ystart + ystep - 1) // ystep
+            row_size = int(math.ceil(self.psize * ppr))
+            size = rows * (row_size + 1)
+            if offset + size > len(raw):
+                raise FormatError('Wrong size for decompressed IDAT chunk.')
+            lines = raw[offset:offset+size].reshape(rows, row_size + 1)
+            offset += size
+            recon = undo_filter_scanlines_array(lines[:,0], lines[:,1:], fo)
+            values = self._unpack_array(recon, ppr)
+            pixels[ystart::ystep, xstart::xstep] = values.reshape(rows, ppr, planes)
+        if offset != len(raw):
+            raise FormatError('Wrong size for decompressed IDAT chunk.')
+        return self.width, self.height, pixels, self.metadata()
+
+    def _unpack_array(self, recon, width):
+        """Convert (rows, row bytes) array of serial format (packed)
+        scanlines that are `width` pixels wide to a (rows, width*planes)
+        array of values.
+        """
+
+        if self.bitdepth == 8:
+            return recon
+        if self.bitdepth == 16:
+            return recon.view('>u2').astype(np.uint16)
+        # Samples per byte
+        spb = 8//self.bitdepth
+        mask = 2**self.bitdepth - 1
+        shifts = self.bitdepth * np.arange(spb - 1, -1, -1, dtype=np.uint8)
+        values = (recon[:,:,None] >> shifts) & mask
+        return values.reshape(recon.shape[0], -1)[:,:width*self.planes]
 
 
     def read_flat(self):
@@ -2131,6 +2628,66 @@ class Reader:
 
         return self._as_rescale(self.asRGBA, 8)
 
+    def asDirectArray(self):
+        """Like :meth:`asDirect`, but decodes with NumPy (see
+        :meth:`read_array`) and returns *pixels* as a (height, width,
+        planes) NumPy array.  Palettes, transparency, and ``sBIT`` are
+        handled as :meth:`asDirect` does.  Requires NumPy.
+        """
+
+        x,y,pixels,meta = self.read_array()
+
+        if self.colormap:
+            meta['colormap'] = False
+            meta['alpha'] = bool(self.trns)
+            meta['bitdepth'] = 8
+            meta['planes'] = 3 + bool(self.trns)
+            plte = np.array(self.palette(), dtype=np.uint8)
+            if pixels.max(initial=0) >= len(plte):
+                raise IndexError('list index out of range')
+            pixels = plte[pixels[:,:,0]]
+        elif self.trns:
+            maxval = 2**meta['bitdepth']-1
+            meta['alpha'] = True
+            meta['planes'] += 1
+            opaque = np.any(pixels != np.array(self.transparent, dtype=pixels.dtype), axis=2)
+            alpha = (opaque * maxval).astype(pixels.dtype)
+            pixels = np.concatenate([pixels, alpha[:,:,None]], axis=2)
+        if self.sbit:
+            sbit = struct.unpack('%dB' % len(self.sbit), self.sbit)
+            targetbitdepth = max(sbit)
+            if targetbitdepth > meta['bitdepth']:
+                raise Error('sBIT chunk %r exceeds bitdepth %d' %
+                    (sbit,self.bitdepth))
+            if min(sbit) <= 0:
+                raise Error('sBIT chunk %r has a 0-entry' % sbit)
+            if targetbitdepth != meta['bitdepth']:
+                pixels = pixels >> (meta['bitdepth'] - targetbitdepth)
+                meta['bitdepth'] = targetbitdepth
+        return x,y,pixels,meta
+
+    def asRGBA8Array(self):
+        """Like :meth:`asRGBA8`, but decodes with NumPy (see
+        :meth:`asDirectArray`) and returns *pixels* as a (height,
+        width, 4) uint8 NumPy array.  Requires NumPy.
+        """
+
+        width,height,pixels,meta = self.asDirectArray()
+        maxval = 2**meta['bitdepth'] - 1
+        if meta['greyscale']:
+            pixels = pixels[:,:,[0,0,0,1] if meta['alpha'] else [0,0,0]]
+        if not meta['alpha']:
+            alpha = np.full(pixels.shape[:2] + (1,), maxval, dtype=pixels.dtype)
+            pixels = np.concatenate([pixels, alpha], axis=2)
+        meta['greyscale'] = False
+        meta['alpha'] = True
+        meta['planes'] = 4
+        if maxval != 255:
+            # int(round(x*factor)), as :meth:`_as_rescale` does
+            pixels = np.rint(pixels * (255.0 / maxval))
+        meta['bitdepth'] = 8
+        return width,height,pixels.astype(np.uint8),meta
+
     def asRGB(self):
         """Return image as RGB pixels.  RGB colour images are passed
         through unchanged; greyscales are expanded into RGB
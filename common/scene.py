@@ -1,6 +1,8 @@
 import json
 from .maths import Vector, Point, Direction, Normal, Frame
+from .bvh import BVH
 from .utils import show_warning
+from . import trace
 
 '''
 The following classes are designed to store details about the scene.
@@ -29,6 +31,12 @@ b) the loading function knows what type `kr` should be when specified
 Note: properties can be expressed as `self.a_property` (object
 attribute) or using the `@property` and `@a_property.setter` function
 attributes (see `eye`, `center`, and `up` in `Camera`).
+
+The `compile_scene` function at bottom turns a loaded Scene into a
+read-only `RenderScene` for rendering.  It precomputes per-surface
+intersection constants (plain floats) once, so that they are not
+recomputed for every ray.  Compile once and reuse the RenderScene when
+rendering the same scene multiple times.
 '''
 
 
@@ -103,7 +111,8 @@ class Camera:
 class Scene:
     __slots__ = [
         'camera', 'resolution_width', 'resolution_height', 'pixel_samples',
-        'background', 'ambient', 'lights', 'surfaces'
+        'background', 'ambient', 'lights', 'surfaces',
+        'max_bounces', 'reflection_cutoff',
         ]
     def __init__(self):
         self.camera = Camera()
@@ -114,6 +123,8 @@ class Scene:
         self.ambient    = Vector((0.2,0.2,0.2))     # color of ambient lighting (hack)
         self.lights   = [Light()]                   # lights in scene
         self.surfaces = [Surface()]                 # surfaces in scene
+        self.max_bounces = 1                        # max number of reflection bounces per camera ray
+        self.reflection_cutoff = 0.0                # skip reflection rays whose throughput (max channel) is not above this
 
 
 def scene_from_file(filename):
@@ -143,5 +154,130 @@ def scene_from_file(filename):
             setattr(obj, k, v)
         return obj
 
-    data = json.load(open(filename, 'rt'))
-    return parse(data, Scene)
+    with trace.span('scene load', file=filename):
+        data = json.load(open(filename, 'rt'))
+        return parse(data, Scene)
+
+
+# surface kinds of RenderSurface, used to dispatch intersection
+SURFACE_SPHERE = 0
+SURFACE_QUAD   = 1
+SURFACE_CIRCLE = 2
+
+
+def _read_only_from_state(cls, state):
+    obj = cls.__new__(cls)
+    obj._init(**state)
+    return obj
+
+class _ReadOnly:
+    __slots__ = []
+    def __setattr__(self, k, v):
+        raise AttributeError('%s is read-only' % type(self).__name__)
+    def _init(self, **kwargs):
+        for k,v in kwargs.items(): object.__setattr__(self, k, v)
+    def __reduce__(self):
+        # pickle support (default unpickling would call the blocked __setattr__)
+        return (_read_only_from_state, (type(self), {k:getattr(self, k) for k in self.__slots__}))
+
+
+class RenderSurface(_ReadOnly):
+    '''
+    Read-only surface with intersection constants precomputed as floats:
+        kind:           SURFACE_SPHERE, SURFACE_QUAD, or SURFACE_CIRCLE
+        ox,oy,oz:       center of surface
+        nx,ny,nz:       normal of quad/circle plane (frame z)
+        xx,xy,xz:       in-plane x axis of quad/circle (frame x)
+        yx,yy,yz:       in-plane y axis of quad/circle (frame y)
+        d:              plane offset (n dot o)
+        radius,radius2: size of surface and its square
+        o,z:            center and normal as Point and Direction (used for shading)
+        material:       reflective properties of surface
+    '''
+    __slots__ = [
+        'kind', 'ox','oy','oz', 'nx','ny','nz', 'xx','xy','xz', 'yx','yy','yz',
+        'd', 'radius','radius2', 'o','z', 'material',
+        ]
+    def __init__(self, surface:Surface):
+        f,r = surface.frame,surface.radius
+        if surface.is_quad:     kind = SURFACE_QUAD
+        elif surface.is_circle: kind = SURFACE_CIRCLE
+        else:                   kind = SURFACE_SPHERE
+        self._init(
+            kind=kind,
+            ox=f.o.x, oy=f.o.y, oz=f.o.z,
+            nx=f.z.x, ny=f.z.y, nz=f.z.z,
+            xx=f.x.x, xy=f.x.y, xz=f.x.z,
+            yx=f.y.x, yy=f.y.y, yz=f.y.z,
+            d=f.z.dot(f.o),
+            radius=r, radius2=r*r,
+            o=f.o, z=f.z,
+            material=surface.material,
+        )
+
+
+class RenderCamera(_ReadOnly):
+    '''
+    Read-only camera:
+        frame:          frame (origin and orientation) of camera, a copy of the
+                        camera's, so changing the Camera does not change it
+        width,height:   size of image plane
+        dist:           distance from camera to center of image plane
+    '''
+    __slots__ = ['frame','width','height','dist']
+    def __init__(self, camera:Camera):
+        frame = Frame.__new__(Frame)
+        frame.o,frame.x,frame.y,frame.z = camera.frame.o,camera.frame.x,camera.frame.y,camera.frame.z
+        self._init(frame=frame, width=camera.width, height=camera.height, dist=camera.dist)
+
+
+class RenderLight(_ReadOnly):
+    '''
+    Read-only light:
+        o:          position of light
+        z:          direction of light (directional lights)
+        intensity:  light intensity in red,green,blue
+        is_point:   True: point light; False: directional
+    '''
+    __slots__ = ['o','z','intensity','is_point']
+    def __init__(self, light:Light):
+        self._init(o=light.frame.o, z=light.frame.z, intensity=light.intensity, is_point=light.is_point)
+
+
+class RenderScene(_ReadOnly):
+    '''
+    Read-only scene prepared for rendering (see `compile_scene`).
+    camera is a RenderCamera, surfaces and lights are tuples of
+    RenderSurface and RenderLight in the same order as in the source
+    scene, and bvh indexes surfaces (it is built here, so compiling a
+    changed Scene gives an up-to-date BVH).
+    '''
+    __slots__ = [
+        'camera', 'resolution_width', 'resolution_height', 'pixel_samples',
+        'background', 'ambient', 'lights', 'surfaces', 'bvh',
+        'max_bounces', 'reflection_cutoff',
+        ]
+    def __init__(self, scene:Scene):
+        surfaces = tuple(RenderSurface(surface) for surface in scene.surfaces)
+        with trace.span('bvh build', surfaces=len(surfaces)):
+            bvh = BVH(surfaces)
+        self._init(
+            camera=RenderCamera(scene.camera),
+            resolution_width=scene.resolution_width,
+            resolution_height=scene.resolution_height,
+            pixel_samples=scene.pixel_samples,
+            background=scene.background,
+            ambient=scene.ambient,
+            lights=tuple(RenderLight(light) for light in scene.lights),
+            surfaces=surfaces,
+            bvh=bvh,
+            max_bounces=scene.max_bounces,
+            reflection_cutoff=scene.reflection_cutoff,
+        )
+
+
+def compile_scene(scene):
+    ''' returns RenderScene for scene (scene is returned as-is if it is already compiled) '''
+    if type(scene) is RenderScene: return scene
+    with trace.span('compile scene'):
+        return RenderScene(scene)
@@ -0,0 +1,91 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .scene import compile_scene
+
+'''
+The following class stores a scene in structure-of-arrays form: one
+contiguous NumPy array per property, with one row per surface or light.
+
+This representation is meant for batch kernels (see `wavefront.py`).
+Pickling a SceneArrays copies a handful of flat buffers rather than an
+object graph of Surfaces, Frames, and Vectors.
+
+Surface arrays (S = number of surfaces):
+    surface_kind:       (S,)   int8     SURFACE_SPHERE, SURFACE_QUAD, SURFACE_CIRCLE
+    surface_center:     (S,3)  float64  frame origin
+    surface_normal:     (S,3)  float64  frame z
+    surface_x:          (S,3)  float64  frame x (in-plane axis of quads/circles)
+    surface_y:          (S,3)  float64  frame y (in-plane axis of quads/circles)
+    surface_d:          (S,)   float64  plane offset (normal dot center)
+    surface_radius:     (S,)   float64
+    surface_radius2:    (S,)   float64  radius squared
+    material_kd, material_ks, material_kr: (S,3) float64
+    material_n:         (S,)   float64  specular exponent
+
+Light arrays (L = number of lights):
+    light_position:     (L,3)  float64  frame origin
+    light_direction:    (L,3)  float64  frame z
+    light_intensity:    (L,3)  float64
+    light_is_point:     (L,)   bool
+
+Scene values:
+    background, ambient: (3,) float64
+
+Note: NumPy is required to build a SceneArrays.
+'''
+
+
+class SceneArrays:
+    fields = [
+        'surface_kind', 'surface_center', 'surface_normal', 'surface_x', 'surface_y',
+        'surface_d', 'surface_radius', 'surface_radius2',
+        'material_kd', 'material_ks', 'material_n', 'material_kr',
+        'light_position', 'light_direction', 'light_intensity', 'light_is_point',
+        'background', 'ambient',
+        ]
+    __slots__ = fields
+
+    def __init__(self, scene):
+        ''' builds arrays from scene (Scene or RenderScene) '''
+        assert np is not None, 'SceneArrays requires NumPy to be installed'
+
+        scene = compile_scene(scene)
+        surfaces,lights = scene.surfaces,scene.lights
+        def vec3(vals): return np.array(vals, dtype=np.float64).reshape(-1,3)
+        def vec1(vals): return np.array(vals, dtype=np.float64)
+
+        self.surface_kind    = np.array([s.kind for s in surfaces], dtype=np.int8)
+        self.surface_center  = vec3([(s.ox,s.oy,s.oz) for s in surfaces])
+        self.surface_normal  = vec3([(s.nx,s.ny,s.nz) for s in surfaces])
+        self.surface_x       = vec3([(s.xx,s.xy,s.xz) for s in surfaces])
+        self.surface_y       = vec3([(s.yx,s.yy,s.yz) for s in surfaces])
+        self.surface_d       = vec1([s.d for s in surfaces])
+        self.surface_radius  = vec1([s.radius for s in surfaces])
+        self.surface_radius2 = vec1([s.radius2 for s in surfaces])
+        self.material_kd     = vec3([s.material.kd.xyz for s in surfaces])
+        self.material_ks     = vec3([s.material.ks.xyz for s in surfaces])
+        self.material_n      = vec1([s.material.n for s in surfaces])
+        self.material_kr     = vec3([s.material.kr.xyz for s in surfaces])
+
+        self.light_position  = vec3([l.o.xyz for l in lights])
+        self.light_direction = vec3([l.z.xyz for l in lights])
+        self.light_intensity = vec3([l.intensity.xyz for l in lights])
+        self.light_is_point  = np.array([bool(l.is_point) for l in lights], dtype=bool)
+
+        self.background = vec1(scene.background.xyz)
+        self.ambient    = vec1(scene.ambient.xyz)
+
+    @property
+    def surface_count(self): return len(self.surface_kind)
+    @property
+    def light_count(self): return len(self.light_is_point)
+    @property
+    def nbytes(self): return sum(getattr(self, k).nbytes for k in self.fields)
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.fields}
+    def __setstate__(self, state):
+        for k,v in state.items(): setattr(self, k, v)
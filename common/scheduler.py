@@ -0,0 +1,160 @@
+import time
+import queue as queue_module
+import multiprocessing
+
+'''
+The following class schedules tiles of work (ex: image tiles to render)
+across worker processes using work stealing.
+
+Tiles are sorted by predicted cost (most expensive first) and dealt
+round-robin into one deque per worker, so each worker starts with a
+similar amount of work and works on its expensive tiles first.  A
+worker takes tiles from the front of its own deque.  Once its deque is
+empty, it steals from the back (the cheapest end) of the deque that has
+the most tiles left.  Workers only go idle when there is no work left
+anywhere, so the render does not wait on one worker that was given the
+expensive tiles.
+
+The deques live in shared memory (`multiprocessing.Array`) and are
+guarded by a single lock; tiles are coarse enough that the lock is not
+contended.
+
+Each worker process calls `initializer(*initargs)` once, then `fn(tile)`
+for every tile it takes.  `TileScheduler.run` yields the results of `fn`
+in completion order.  Afterward, `stats` holds per-worker statistics and
+`report` formats them.  A worker's utilization is the CPU time it spent
+in `fn` (`time.process_time`) over the wall time of the run, so it
+shows time lost waiting for a core when workers share cores, not only
+time idle waiting for work.  If a worker fails (raises, or exits without
+finishing, ex: killed), `run` raises RuntimeError.
+'''
+
+
+class WorkerStats:
+    __slots__ = ['worker','tiles','stolen','busy','cpu','wall']
+    def __init__(self, worker):
+        self.worker = worker    # worker index
+        self.tiles  = 0         # number of tiles rendered
+        self.stolen = 0         # number of those tiles stolen from other workers
+        self.busy   = 0.0       # seconds (wall time) spent in fn
+        self.cpu    = 0.0       # seconds of CPU time (of the worker process) spent in fn
+        self.wall   = 0.0       # seconds from start to end of run (all workers)
+
+    @property
+    def utilization(self):
+        return self.cpu / self.wall if self.wall > 0 else 0.0
+
+
+def _take(w, deque, heads, tails, lock):
+    ''' returns (index into deque, stolen) of tile that worker w should do next, or (None, False) if no work is left '''
+    with lock:
+        if heads[w] < tails[w]:
+            heads[w] += 1
+            return heads[w] - 1, False
+        victim,most = None,0
+        for v in range(len(heads)):
+            remaining = tails[v] - heads[v]
+            if remaining > most: victim,most = v,remaining
+        if victim is None: return None, False
+        tails[victim] -= 1
+        return tails[victim], True
+
+def _worker_main(w, deque, heads, tails, lock, queue, initializer, initargs, fn, tiles):
+    stats = WorkerStats(w)
+    try:
+        if initializer: initializer(*initargs)
+        while True:
+            i,stolen = _take(w, deque, heads, tails, lock)
+            if i is None: break
+            tile = tiles[deque[i]]
+            t0,c0 = time.perf_counter(),time.process_time()
+            result = fn(tile)
+            stats.busy += time.perf_counter() - t0
+            stats.cpu += time.process_time() - c0
+            stats.tiles += 1
+            stats.stolen += stolen
+            queue.put(('tile', result, None))
+    except BaseException as e:
+        queue.put(('error', w, repr(e)))
+        raise
+    queue.put(('done', w, stats))
+
+
+class TileScheduler:
+    poll_interval = 0.1     # seconds between checks for workers that exited without finishing
+
+    def __init__(self, workers:int, fn, initializer=None, initargs=()):
+        self.workers = max(1, workers)
+        self.fn = fn
+        self.initializer = initializer
+        self.initargs = initargs
+        self.stats = []
+
+    def run(self, tiles, costs=None):
+        ''' yields fn(tile) for each tile (in completion order), computed by worker processes '''
+        tiles = list(tiles)
+        n,nw = len(tiles),self.workers
+        order = list(range(n))
+        if costs is not None:
+            order.sort(key=lambda i: -costs[i])
+
+        # deal tiles round-robin; worker w's deque is deque[w*cap + heads[w] : w*cap + tails[w]]
+        cap = (n + nw - 1) // nw
+        deque = multiprocessing.Array('i', nw * cap, lock=False)
+        heads = multiprocessing.Array('i', nw, lock=False)
+        tails = multiprocessing.Array('i', nw, lock=False)
+        for w in range(nw):
+            mine = order[w::nw]
+            deque[w*cap:w*cap+len(mine)] = mine
+            heads[w],tails[w] = w*cap,w*cap+len(mine)
+        lock = multiprocessing.Lock()
+        queue = multiprocessing.Queue()
+
+        time_start = time.perf_counter()
+        procs = [
+            multiprocessing.Process(
+                target=_worker_main,
+                args=(w, deque, heads, tails, lock, queue, self.initializer, self.initargs, self.fn, tiles),
+                daemon=True,
+            )
+            for w in range(nw)
+        ]
+        for p in procs: p.start()
+
+        self.stats = []
+        try:
+            done = set()
+            exited = set()
+            while len(done) < nw:
+                try:
+                    kind,a,b = queue.get(timeout=self.poll_interval)
+                except queue_module.Empty:
+                    # a worker that exited without 'done' failed, once its messages (if any) are read
+                    lost = {w for w,p in enumerate(procs) if p.exitcode is not None} - done
+                    if lost & exited:
+                        w = min(lost & exited)
+                        raise RuntimeError('worker %d exited (exit code %d) without finishing' % (w, procs[w].exitcode))
+                    exited = lost
+                    continue
+                if kind == 'tile':
+                    yield a
+                elif kind == 'done':
+                    self.stats.append(b)
+                    done.add(a)
+                else:
+                    raise RuntimeError('worker %d failed: %s' % (a, b))
+            time_total = time.perf_counter() - time_start
+            for s in self.stats: s.wall = time_total
+        finally:
+            for p in procs:
+                if p.is_alive(): p.terminate()
+                p.join()
+        self.stats.sort(key=lambda s: s.worker)
+
+    def report(self):
+        ''' returns lines summarizing per-worker statistics of last run '''
+        return [
+            'Worker %d: %d tiles (%d stolen), busy %0.2fs (%0.2fs CPU) of %0.2fs, %0.0f%% utilized' % (
+                s.worker, s.tiles, s.stolen, s.busy, s.cpu, s.wall, 100 * s.utilization)
+            for s in self.stats
+        ]
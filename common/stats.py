@@ -0,0 +1,99 @@
+from .scene import SURFACE_SPHERE, SURFACE_QUAD, SURFACE_CIRCLE
+
+'''
+The following class stores statistics of a render: how many rays of
+each kind were traced, how many ray-surface intersection tests were done
+(by surface kind), and how long each phase took.
+
+Statistics are only collected when `RenderOptions.stats` is True (see
+`render_with_stats` in P02_Raytrace.py); otherwise the engines skip all
+counting, so collecting costs nothing when it is off.
+
+Each tile is counted into its own RenderStats, which is sent back with
+the tile's pixels and added (`add`) into the render's RenderStats.  Phase
+times (ray_gen, traversal, shading) are summed over tiles, so with
+several workers they add up to more than the wall time of the render
+(`render_time`).  `save_time` is the time to write the image file.
+
+Phases:
+    ray_gen:    generating camera rays
+    traversal:  finding closest hits and testing shadow rays (BVH and surface tests)
+    shading:    everything else of tracing (lighting, reflection rays, ...)
+'''
+
+
+# names of surface kinds, indexed by kind (see `tests`)
+SURFACE_KIND_NAMES = {SURFACE_SPHERE: 'sphere', SURFACE_QUAD: 'quad', SURFACE_CIRCLE: 'circle'}
+
+class RenderStats:
+    __slots__ = [
+        'camera_rays','shadow_rays','reflection_rays','reflection_rays_skipped',
+        'tests','hits','occluded',
+        'ray_gen_time','traversal_time','shading_time','save_time','render_time',
+        ]
+    def __init__(self):
+        self.camera_rays     = 0        # camera rays traced
+        self.shadow_rays     = 0        # shadow rays traced (one per light per shaded hit)
+        self.reflection_rays = 0        # reflection rays traced
+        self.reflection_rays_skipped = 0    # reflection rays not traced (throughput at or below cutoff)
+        self.tests    = [0] * len(SURFACE_KIND_NAMES)   # ray-surface intersection tests, indexed by surface kind
+        self.hits     = 0               # camera and reflection rays that hit a surface
+        self.occluded = 0               # shadow rays that hit a surface (light is blocked)
+        self.ray_gen_time   = 0.0       # seconds (see phases above)
+        self.traversal_time = 0.0
+        self.shading_time   = 0.0
+        self.save_time      = 0.0
+        self.render_time    = 0.0       # wall seconds of render (not including save)
+
+    @property
+    def rays(self):
+        return self.camera_rays + self.shadow_rays + self.reflection_rays
+
+    def add(self, other):
+        ''' adds counts and times of other RenderStats to self, returning self '''
+        for k in self.__slots__:
+            if k == 'tests':
+                self.tests = [a + b for a,b in zip(self.tests, other.tests)]
+            else:
+                setattr(self, k, getattr(self, k) + getattr(other, k))
+        return self
+
+    def as_dict(self):
+        ''' returns stats as a dict (ex: for JSON), with tests by surface kind name and times in seconds '''
+        return {
+            'rays': {
+                'camera': self.camera_rays,
+                'shadow': self.shadow_rays,
+                'reflection': self.reflection_rays,
+                'reflection_skipped': self.reflection_rays_skipped,
+                'total': self.rays,
+            },
+            'tests': {SURFACE_KIND_NAMES[kind]: n for kind,n in enumerate(self.tests)},
+            'hits': self.hits,
+            'occluded': self.occluded,
+            'times': {
+                'ray_gen': self.ray_gen_time,
+                'traversal': self.traversal_time,
+                'shading': self.shading_time,
+                'save': self.save_time,
+                'render': self.render_time,
+            },
+        }
+
+    def summary(self):
+        ''' returns list of lines summarizing stats '''
+        traced = self.camera_rays + self.reflection_rays
+        tests = sum(self.tests)
+        return [
+            'Rays: %d camera, %d shadow, %d reflection (%d skipped), %d total' % (
+                self.camera_rays, self.shadow_rays, self.reflection_rays, self.reflection_rays_skipped, self.rays),
+            'Hits: %d of %d camera and reflection rays (%0.1f%%), %d of %d shadow rays occluded (%0.1f%%)' % (
+                self.hits, traced, _percent(self.hits, traced), self.occluded, self.shadow_rays, _percent(self.occluded, self.shadow_rays)),
+            'Tests: %s, %d total (%0.1f per ray)' % (
+                ', '.join('%d %s' % (n, SURFACE_KIND_NAMES[kind]) for kind,n in enumerate(self.tests)), tests, tests / self.rays if self.rays else 0),
+            'Times: ray gen %0.2fs, traversal %0.2fs, shading %0.2fs, save %0.2fs (render %0.2fs wall)' % (
+                self.ray_gen_time, self.traversal_time, self.shading_time, self.save_time, self.render_time),
+        ]
+
+def _percent(n, total):
+    return 100 * n / total if total else 0.0
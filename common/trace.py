@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import threading
+
+'''
+The following functions record a trace of a render: named spans of time
+(ex: scene load, BVH build, each tile, PNG encode), which may be nested,
+from the main process, its worker processes, and their threads.  `write`
+saves the trace as Chrome trace-event JSON, which can be opened in a
+trace viewer (chrome://tracing or https://ui.perfetto.dev) to see, for
+example, how tiles were scheduled across workers.
+
+Tracing is off until `start` is called.  While it is off, `span` returns
+a shared do-nothing context manager, so a span costs about one call.
+
+Spans are recorded as complete ('X') events, timed with
+`time.perf_counter_ns`, which is a system-wide monotonic clock, so the
+events of different processes line up.  Each process records its own
+events: a worker process calls `start` when tracing is on in the main
+process (see `_init_worker` in P02_Raytrace.py), and sends the events it
+recorded (`take`) back with each result, where the main process adds
+them to its trace (`add`).
+
+    trace.start()
+    with trace.span('scene load', file=filename):
+        scene = scene_from_file(filename)
+    trace.write('trace.json')
+'''
+
+
+_events = None          # events recorded by this process, or None if tracing is off
+_pid = 0                # process id of events (set by start)
+
+
+class _Span:
+    __slots__ = ['name','args','time_beg']
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+    def __enter__(self):
+        self.time_beg = time.perf_counter_ns()
+        return self
+    def __exit__(self, *exc):
+        time_end = time.perf_counter_ns()
+        event = {
+            'name': self.name, 'ph': 'X', 'pid': _pid, 'tid': threading.get_native_id(),
+            'ts': self.time_beg / 1000, 'dur': (time_end - self.time_beg) / 1000,   # microseconds
+        }
+        if self.args: event['args'] = self.args
+        if _events is not None: _events.append(event)
+        return False
+
+class _NoSpan:
+    __slots__ = []
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_no_span = _NoSpan()
+
+
+def enabled():
+    ''' returns True if tracing is on in this process '''
+    return _events is not None
+
+def start(process_name='main'):
+    ''' turns tracing on in this process (discarding events recorded so far), naming the process process_name in the trace '''
+    global _events, _pid
+    _pid = os.getpid()
+    _events = [{'name': 'process_name', 'ph': 'M', 'pid': _pid, 'tid': 0, 'args': {'name': process_name}}]
+
+def span(name:str, **args):
+    '''
+    returns context manager recording the time it is entered as a span named name,
+    with args (JSON-able values) shown with the span; spans entered within it are nested
+    '''
+    if _events is None: return _no_span
+    return _Span(name, args)
+
+def take():
+    ''' returns events recorded since tracing started or last take, removing them (ex: to send to main process) '''
+    if not _events: return []
+    events = _events[:]
+    del _events[:len(events)]
+    return events
+
+def add(events):
+    ''' adds events (from `take` in another process) to the trace of this process, if tracing is on '''
+    if _events is not None: _events.extend(events)
+
+def write(filename:str):
+    ''' writes events recorded by this process (and added from others) to filename as Chrome trace-event JSON '''
+    with open(filename, 'wt') as f:
+        json.dump({'traceEvents': _events or [], 'displayTimeUnit': 'ms'}, f)
@@ -2,6 +2,8 @@ import os
 import time
 import inspect
 
+from . import trace
+
 def show_warning(text):
     print('>>> WARNING <<< : %s' % text)
 
@@ -21,12 +23,14 @@ def put_your_code_here(fn):
     return wrapper
 
 def timed_call(label):
+    ''' decorator printing how long each call of the function took, which is also recorded as a span of the trace (see common/trace.py) '''
     def wrapper(fn):
         def wrapped(*args, **kwargs):
-            time_beg = time.time()
-            ret = fn(*args, **kwargs)
-            time_end = time.time()
-            time_delta = time_end - time_beg
+            with trace.span(label):
+                time_beg = time.perf_counter_ns()
+                ret = fn(*args, **kwargs)
+                time_end = time.perf_counter_ns()
+            time_delta = (time_end - time_beg) / 1e9
             print('Timing: %0.2fs, %s' % (time_delta, label))
             return ret
         return wrapped
@@ -0,0 +1,235 @@
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .image import ArrayImage
+from .scene import SURFACE_SPHERE, SURFACE_QUAD
+from .scene_arrays import SceneArrays
+from . import trace
+
+'''
+The following functions provide a wavefront raytracer implemented with
+NumPy, as an alternative to the per-ray engine in P02_Raytrace.py.
+
+Instead of tracing one `Ray` at a time, `raytrace_wavefront` generates
+a batch of camera rays as (N,3) arrays, intersects the whole batch with
+each surface in turn, shades the hits (Blinn-Phong with shadow rays) in
+bulk, and traces reflection rays as a compacted batch containing only
+the hits on reflective surfaces.
+
+The algorithm mirrors the scalar engine (same ray epsilon, same
+closest-hit tie breaking, same reflection bounces, same normals),
+so images match the scalar engine to within rounding (1/255).
+Reflection rays follow the scene's max_bounces and reflection_cutoff.
+
+Note: NumPy is optional.  `available()` reports if this engine can be
+used.  The scene is read from a `SceneArrays` (see `scene_arrays.py`).
+
+Render statistics are counted into `stats` (a RenderStats, see
+common/stats.py) when one is given; every surface is tested against
+every ray of a batch, so tests are counted per batch, not per ray.
+'''
+
+
+# minimum ray t (matches default `min_dist` of `Ray`)
+ray_min = 0.00005
+
+# number of camera rays traced per batch (bounds memory use)
+batch_size = 1 << 16
+
+
+def available():
+    return np is not None
+
+
+def _dot(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+def _normalize(v):
+    l = np.sqrt(_dot(v, v))
+    l[l == 0] = 1
+    return v / l[:,None]
+
+
+def _intersect_surface(arrays, i, e, d):
+    ''' returns (t, hit) arrays of intersection of rays (e,d) with surface i (t not checked against min/max) '''
+    o = arrays.surface_center[i]
+    if arrays.surface_kind[i] == SURFACE_SPHERE:
+        v = e - o
+        b = 2 * _dot(d, v)
+        c = _dot(v, v) - arrays.surface_radius2[i]
+        disc = b * b - 4 * c
+        hit = disc >= 0
+        t = (-b - np.sqrt(np.where(hit, disc, 0))) / 2
+        return t,hit
+    n = arrays.surface_normal[i]
+    t = ((o - e) @ n) / (d @ n)
+    p = e + d * t[:,None]
+    v = p - o
+    lx,ly = v @ arrays.surface_x[i],v @ arrays.surface_y[i]
+    if arrays.surface_kind[i] == SURFACE_QUAD:
+        hit = (np.abs(lx) <= arrays.surface_radius[i]) & (np.abs(ly) <= arrays.surface_radius[i])
+    else:
+        hit = (lx * lx + ly * ly) <= arrays.surface_radius2[i]
+    return t,hit
+
+def intersect(arrays, e, d, tmax=None, stats=None):
+    '''
+    returns (t, idx) arrays of closest intersection of rays (e,d) with surfaces
+    idx is -1 where ray did not hit.  tmax defaults to infinity.
+    '''
+    if stats is not None: time_beg = time.perf_counter()
+    count = e.shape[0]
+    best_t = np.full(count, np.inf) if tmax is None else tmax.copy()
+    best_i = np.full(count, -1, dtype=np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(arrays.surface_count):
+            t,hit = _intersect_surface(arrays, i, e, d)
+            # t <= best_t keeps later surfaces on ties, like the scalar engine
+            hit &= (t >= ray_min) & (t <= best_t)
+            best_t[hit] = t[hit]
+            best_i[hit] = i
+    if stats is not None:
+        for kind,n in enumerate(np.bincount(arrays.surface_kind, minlength=len(stats.tests))):
+            stats.tests[kind] += count * int(n)
+        stats.hits += int((best_i >= 0).sum())
+        stats.traversal_time += time.perf_counter() - time_beg
+    return best_t,best_i
+
+def occluded(arrays, e, d, tmax, stats=None):
+    ''' returns boolean array, True where ray (e,d) hits any surface with t between ray min and tmax '''
+    if stats is not None: time_beg = time.perf_counter()
+    blocked = np.zeros(e.shape[0], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(arrays.surface_count):
+            todo = ~blocked
+            if not todo.any(): break
+            if stats is not None: stats.tests[arrays.surface_kind[i]] += int(todo.sum())
+            t,hit = _intersect_surface(arrays, i, e[todo], d[todo])
+            blocked[todo] = hit & (t >= ray_min) & (t <= tmax[todo])
+    if stats is not None:
+        stats.shadow_rays += e.shape[0]
+        stats.occluded += int(blocked.sum())
+        stats.traversal_time += time.perf_counter() - time_beg
+    return blocked
+
+
+def irradiance(arrays, e, d, bounce=0, throughput=None, max_bounces=1, cutoff=0.0, counts=None, stats=None):
+    '''
+    returns (N,3) irradiance (color) from scene (SceneArrays) along rays (e,d) (reversed)
+    bounce is number of reflection bounces before rays; throughput is (N,3) product of
+    reflection coefficients along those bounces (None for camera rays).  Reflection rays
+    whose throughput is not above cutoff are skipped (and counted in counts, if given).
+    '''
+    color = np.empty(e.shape)
+    color[:] = arrays.background
+
+    t,idx = intersect(arrays, e, d, stats=stats)
+    hits = np.nonzero(idx >= 0)[0]
+    if hits.size == 0: return color
+
+    e,d,t,idx = e[hits],d[hits],t[hits],idx[hits]
+    if throughput is not None: throughput = throughput[hits]
+    p = e + d * t[:,None]
+    is_quad = arrays.surface_kind[idx] == SURFACE_QUAD
+    n = _normalize(p - arrays.surface_center[idx])
+    n[is_quad] = arrays.surface_normal[idx[is_quad]]
+
+    kd,ks = arrays.material_kd[idx],arrays.material_ks[idx]
+    ns,kr = arrays.material_n[idx],arrays.material_kr[idx]
+    c = arrays.ambient * kd
+    for light in range(arrays.light_count):
+        l = arrays.light_position[light] - p
+        dist = np.sqrt(_dot(l, l))
+        ldir = l / dist[:,None]
+        lit = ~occluded(arrays, p, ldir, dist, stats)
+        if not lit.any(): continue
+        h = _normalize(ldir - d)
+        intensity = arrays.light_intensity[light]
+        if arrays.light_is_point[light]:
+            response = intensity / (dist * dist)[:,None]
+            direction = ldir
+        else:
+            response = np.broadcast_to(intensity, p.shape)
+            direction = np.broadcast_to(arrays.light_direction[light], p.shape)
+        spec = ks * (np.maximum(0, _dot(n, h)) ** ns)[:,None]
+        contrib = response * (kd + spec) * np.maximum(0, _dot(n, direction))[:,None]
+        c[lit] += contrib[lit]
+
+    if bounce < max_bounces:
+        # compacted queue of reflection rays: only hits whose reflected light would contribute
+        throughput = kr if throughput is None else throughput * kr
+        contributes = throughput.max(axis=1) > cutoff
+        if counts is not None:
+            counts['reflection_rays_skipped'] = counts.get('reflection_rays_skipped', 0) + int((~contributes).sum())
+        refl = np.nonzero(contributes)[0]
+        if refl.size:
+            dr,nr = d[refl],n[refl]
+            rd = _normalize(dr - 2 * _dot(dr, nr)[:,None] * nr)
+            if stats is not None: stats.reflection_rays += refl.size
+            c[refl] += kr[refl] * irradiance(arrays, p[refl], rd, bounce+1, throughput[refl], max_bounces, cutoff, counts, stats)
+
+    color[hits] = c
+    return color
+
+
+def camera_rays(scene, row0, row1):
+    '''
+    returns (e,d) arrays of camera rays for image rows [row0,row1)
+    rays are ordered by row, then column, then sample (pixel_samples^2 per pixel)
+    '''
+    cam = scene.camera
+    o = np.asarray(tuple(cam.frame.o))
+    x,y,z = (np.asarray(tuple(a)) for a in (cam.frame.x, cam.frame.y, cam.frame.z))
+    W,H,ps = scene.resolution_width,scene.resolution_height,scene.pixel_samples
+
+    rows = np.arange(row0, row1, dtype=np.float64)
+    cols = np.arange(W, dtype=np.float64)
+    offs = (np.arange(ps, dtype=np.float64) + 0.5) / ps
+    # sample index s = col2*ps + row2, matching the scalar engine's loop order
+    su = np.repeat(offs, ps)
+    sv = np.tile(offs, ps)
+    u = (cols[None,:,None] + su[None,None,:]) / W
+    v = 1 - (rows[:,None,None] + sv[None,None,:]) / H
+    u,v = np.broadcast_arrays(u, v)
+    u,v = u.reshape(-1),v.reshape(-1)
+
+    q = o + ((u - 0.5) * cam.width)[:,None] * x + ((v - 0.5) * cam.height)[:,None] * y - cam.dist * z
+    d = _normalize(q - o)
+    e = np.broadcast_to(o, d.shape)
+    return e,d
+
+
+def raytrace_wavefront(scene, counts=None, stats=None):
+    '''
+    computes image of scene (RenderScene) using batched raytracing
+    counts (dict) receives ray counts; stats (RenderStats), if given, receives render statistics
+    '''
+    assert available(), 'the numpy engine requires NumPy to be installed'
+    time_beg = time.perf_counter()
+
+    with trace.span('scene arrays'):
+        arrays = SceneArrays(scene)
+    W,H,ps = scene.resolution_width,scene.resolution_height,scene.pixel_samples
+    samples = ps * ps
+    rows_per_batch = max(1, batch_size // (W * samples))
+
+    image = ArrayImage(W, H, dtype=np.float64)
+    for row0 in range(0, H, rows_per_batch):
+        row1 = min(H, row0 + rows_per_batch)
+        with trace.span('batch', rows=[row0, row1]):
+            if stats is not None: time_gen = time.perf_counter()
+            e,d = camera_rays(scene, row0, row1)
+            if stats is not None:
+                stats.ray_gen_time += time.perf_counter() - time_gen
+                stats.camera_rays += e.shape[0]
+            color = irradiance(arrays, e, d, max_bounces=scene.max_bounces, cutoff=scene.reflection_cutoff, counts=counts, stats=stats)
+            image.set_tile((0, row0), color.reshape(row1 - row0, W, samples, 3).sum(axis=2) / samples)
+
+    if stats is not None:
+        time_total = time.perf_counter() - time_beg
+        stats.shading_time += max(0.0, time_total - stats.ray_gen_time - stats.traversal_time)
+    return image
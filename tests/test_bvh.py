@@ -0,0 +1,106 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.maths import Point, Direction, Frame, Ray
+from common.scene import Scene, Surface, compile_scene
+from P02_Raytrace import intersect_surface
+
+'''
+Checks `BVH.closest` and `BVH.any_hit` against a linear scan over all
+surfaces, which is what the BVH must match pixel for pixel.
+'''
+
+
+def random_scene(rng, n, duplicates=0):
+    ''' returns Scene of n random spheres, quads, and circles, plus copies of the first `duplicates` surfaces (exact ties) '''
+    scene = Scene()
+    surfaces = []
+    for i in range(n):
+        s = Surface()
+        o = Point((rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-5, 5)))
+        z = Direction((rng.gauss(0, 1), rng.gauss(0, 1), rng.gauss(0, 1)))
+        s.frame = Frame(o=o, z=z)
+        s.radius = rng.uniform(0.2, 1.5)
+        s.is_quad = i % 3 == 1
+        s.is_circle = i % 3 == 2
+        surfaces.append(s)
+    for s in surfaces[:duplicates]:
+        d = Surface()
+        d.frame, d.radius, d.is_quad, d.is_circle = s.frame, s.radius, s.is_quad, s.is_circle
+        surfaces.append(d)
+    scene.surfaces = surfaces
+    return compile_scene(scene)
+
+def random_rays(rng, n):
+    for _ in range(n):
+        a = Point((rng.uniform(-8, 8), rng.uniform(-8, 8), rng.uniform(-8, 8)))
+        b = Point((rng.uniform(-3, 3), rng.uniform(-3, 3), rng.uniform(-3, 3)))
+        yield Ray.from_segment(a, b) if rng.random() < 0.5 else Ray.from_segment_no_max(a, b)
+
+def linear_closest(ray, surfaces):
+    ''' returns (t, surface) of closest hit, ties going to the later surface (t <= closest t) '''
+    best_t, best = ray.max, None
+    for s in surfaces:
+        t = intersect_surface(s, ray)
+        if t is not None and ray.min <= t <= best_t:
+            best_t, best = t, s
+    return None if best is None else (best_t, best)
+
+def linear_any_hit(ray, surfaces):
+    return any(t is not None and ray.min <= t <= ray.max for t in (intersect_surface(s, ray) for s in surfaces))
+
+
+def test_closest_matches_linear_scan():
+    rng = random.Random(1)
+    scene = random_scene(rng, 200)
+    hits = 0
+    for ray in random_rays(rng, 2000):
+        expected = linear_closest(ray, scene.surfaces)
+        hit = scene.bvh.closest(ray, scene.surfaces, intersect_surface)
+        assert hit == expected
+        hits += hit is not None
+    assert hits > 100
+
+def test_closest_ties_go_to_later_surface():
+    rng = random.Random(2)
+    scene = random_scene(rng, 60, duplicates=60)
+    ties = 0
+    for ray in random_rays(rng, 2000):
+        expected = linear_closest(ray, scene.surfaces)
+        hit = scene.bvh.closest(ray, scene.surfaces, intersect_surface)
+        assert hit == expected
+        if hit is not None:
+            assert scene.surfaces.index(hit[1]) >= 60     # the copy, not the original
+            ties += 1
+    assert ties > 50
+
+def test_any_hit_matches_linear_scan():
+    rng = random.Random(3)
+    scene = random_scene(rng, 200, duplicates=20)
+    blocked = 0
+    for ray in random_rays(rng, 2000):
+        expected = linear_any_hit(ray, scene.surfaces)
+        assert scene.bvh.any_hit(ray, scene.surfaces, intersect_surface) == expected
+        blocked += expected
+    assert 100 < blocked < 2000
+
+def test_empty_scene():
+    scene = Scene()
+    scene.surfaces = []
+    scene = compile_scene(scene)
+    ray = Ray.from_segment_no_max(Point((0, 0, 5)), Point((0, 0, 0)))
+    assert scene.bvh.closest(ray, scene.surfaces, intersect_surface) is None
+    assert scene.bvh.any_hit(ray, scene.surfaces, intersect_surface) is False
+
+def test_recompiled_scene_sees_moved_surface():
+    scene = Scene()
+    scene.surfaces = [Surface()]
+    ray = Ray.from_segment_no_max(Point((5, 0, 10)), Point((5, 0, 0)))
+    compiled = compile_scene(scene)
+    assert compiled.bvh.closest(ray, compiled.surfaces, intersect_surface) is None
+    scene.surfaces[0].frame = Frame(o=Point((5, 0, 0)))
+    compiled = compile_scene(scene)
+    assert compiled.bvh.closest(ray, compiled.surfaces, intersect_surface) is not None
@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common import png
+
+np = pytest.importorskip('numpy')
+
+'''
+Checks the NumPy paths of common/png.py against its pure-Python paths.
+'''
+
+
+# (greyscale, alpha) => planes
+FORMATS = [(True, False), (True, True), (False, False), (False, True)]
+
+def random_image(rng, width, height, planes, bitdepth):
+    ''' returns (height, width*planes) array of random, partly smooth values (so every filter gets exercised) '''
+    maxval = 2**bitdepth - 1
+    noise = rng.integers(0, maxval + 1, size=(height, width * planes))
+    ramp = (np.arange(width * planes)[None, :] * 7 + np.arange(height)[:, None] * 3) % (maxval + 1)
+    return np.where(rng.random((height, width * planes)) < 0.5, noise, ramp).astype(np.uint16 if bitdepth > 8 else np.uint8)
+
+def encode(writer, rows):
+    f = io.BytesIO()
+    writer.write(f, rows)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize('bitdepth', [8, 16])
+@pytest.mark.parametrize('greyscale,alpha', FORMATS)
+@pytest.mark.parametrize('filter_type', [0, 1, 2, 3, 4, 'adaptive'])
+def test_write_ndarray_matches_list_writer(bitdepth, greyscale, alpha, filter_type):
+    planes = (1 if greyscale else 3) + alpha
+    # fixed seed per case ('adaptive' is filter 5), so every run checks the same images
+    rng = np.random.default_rng([bitdepth, planes, 5 if filter_type == 'adaptive' else filter_type])
+    for width, height in [(1, 1), (5, 3), (37, 29)]:
+        a = random_image(rng, width, height, planes, bitdepth)
+        args = dict(width=width, height=height, greyscale=greyscale, alpha=alpha, bitdepth=bitdepth, filter_type=filter_type)
+        # small chunk_limit, so the IDAT chunking is checked too
+        expected = encode(png.Writer(chunk_limit=97, **args), a.tolist())
+        f = io.BytesIO()
+        png.Writer(chunk_limit=97, **args).write_ndarray(f, a)
+        assert f.getvalue() == expected
+
+
+# bit depths below 8 are greyscale only
+@pytest.mark.parametrize('bitdepth,greyscale,alpha', [(b, True, False) for b in (1, 2, 4)] + [(b,) + f for b in (8, 16) for f in FORMATS])
+@pytest.mark.parametrize('interlace', [False, True])
+def test_read_array_round_trip(bitdepth, greyscale, alpha, interlace):
+    rng = np.random.default_rng(bitdepth * 4 + interlace * 2 + alpha)
+    planes = (1 if greyscale else 3) + alpha
+    for width, height in [(1, 1), (3, 9), (17, 13)]:
+        a = random_image(rng, width, height, planes, bitdepth)
+        data = encode(png.Writer(width, height, greyscale=greyscale, alpha=alpha, bitdepth=bitdepth,
+                                 interlace=interlace, filter_type='adaptive' if not interlace else 0), a.tolist())
+        w, h, pixels, meta = png.Reader(bytes=data).read_array()
+        assert (w, h) == (width, height)
+        assert pixels.shape == (height, width, planes)
+        assert np.array_equal(pixels.reshape(height, -1), a)
+        # same as the pure-Python decoder
+        _, _, rows, _ = png.Reader(bytes=data).read()
+        assert [list(row) for row in rows] == a.tolist()
+
+def test_rgba8_array_matches_list_decoder():
+    rng = np.random.default_rng(5)
+    a = random_image(rng, 11, 7, 3, 16)
+    data = encode(png.Writer(11, 7, bitdepth=16), a.tolist())
+    _, _, pixels, _ = png.Reader(bytes=data).asRGBA8Array()
+    _, _, rows, _ = png.Reader(bytes=data).asRGBA8()
+    assert pixels.reshape(7, -1).tolist() == [list(row) for row in rows]
+
+
+@pytest.mark.parametrize('threads', [1, 2, 4])
+@pytest.mark.parametrize('level', [-1, 0, 1, 9])
+def test_parallel_compressor_output_decompresses(threads, level):
+    rng = np.random.default_rng(threads * 10 + level)
+    # mix of incompressible and repetitive data, so back-references cross segment boundaries
+    data = b''.join(rng.bytes(int(n)) + b'abcdefgh' * int(n) for n in rng.integers(1, 3000, size=40))
+    compressor = png.ParallelCompressor(level, threads, segment_size=4096)
+    out, i = [], 0
+    for n in rng.integers(0, 9000, size=len(data) // 2000 + 1):
+        out.append(compressor.compress(data[i:i+n]))
+        i += n
+        if n % 5 == 0:
+            out.append(compressor.flush(zlib.Z_SYNC_FLUSH))
+            assert zlib.decompressobj().decompress(b''.join(out)) == data[:i]
+    out.append(compressor.compress(data[i:]))
+    out.append(compressor.flush())
+    assert zlib.decompress(b''.join(out)) == data
+
+def test_threaded_writer_output_decodes_the_same():
+    rng = np.random.default_rng(7)
+    a = random_image(rng, 300, 200, 4, 8)
+    args = dict(width=300, height=200, alpha=True, bitdepth=8, filter_type='adaptive')
+    expected = encode(png.Writer(**args), a.tolist())
+    data = encode(png.Writer(compression_threads=3, **args), a.tolist())
+    assert png.Reader(bytes=data).read_array()[2].reshape(200, -1).tolist() == a.tolist()
+    assert zlib_data(data) == zlib_data(expected)
+
+def zlib_data(data):
+    ''' returns decompressed IDAT data of PNG bytes '''
+    reader = png.Reader(bytes=data)
+    reader.preamble()
+    return zlib.decompress(b''.join(reader.iteridat()))
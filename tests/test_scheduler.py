@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import signal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.scheduler import TileScheduler
+
+'''
+Checks that TileScheduler computes every tile once, and that a failing
+worker makes `run` raise instead of hanging.
+'''
+
+
+def square(tile): return tile * tile
+
+def sleeping(tile): time.sleep(0.05)
+
+def failing_initializer(): raise ValueError('initializer failed')
+
+def failing(tile):
+    if tile == 5: raise ValueError('tile failed')
+    return tile
+
+def killed(tile):
+    if tile == 5: os.kill(os.getpid(), signal.SIGKILL)
+    return tile
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_run_computes_every_tile(workers):
+    scheduler = TileScheduler(workers, square)
+    costs = [(t * 7) % 11 for t in range(40)]
+    assert sorted(scheduler.run(range(40), costs)) == [t * t for t in range(40)]
+    assert sum(s.tiles for s in scheduler.stats) == 40
+    assert len(scheduler.report()) == workers
+
+def test_utilization_counts_cpu_time():
+    # time in fn spent off the CPU (here sleeping) is busy, but not utilized
+    scheduler = TileScheduler(1, sleeping)
+    list(scheduler.run(range(4)))
+    s, = scheduler.stats
+    assert s.busy >= 0.2 and s.cpu < s.busy / 2
+    assert s.utilization < 0.5
+
+@pytest.mark.parametrize('fn,initializer,message', [
+    (square, failing_initializer, 'initializer failed'),
+    (failing, None, 'tile failed'),
+    (killed, None, 'without finishing'),
+])
+def test_failed_worker_raises(fn, initializer, message):
+    scheduler = TileScheduler(2, fn, initializer=initializer)
+    with pytest.raises(RuntimeError, match=message):
+        list(scheduler.run(range(10)))